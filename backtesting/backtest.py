@@ -18,7 +18,8 @@ import time
 
 class Backtest(object):
     def __init__(self, csv_dir, symbol_list, initial_capital, heartbeat, start_date, data_handler, execution_handler,
-                 portfolio, strategy):
+                 portfolio, strategy, strategy_params=None, portfolio_params=None, data_handler_params=None,
+                 monitor=None):
         """
         :param csv_dir: string; head root of CSV data.
 
@@ -37,6 +38,14 @@ class Backtest(object):
         :param portfolio: Portfolio; keep track the data to update current holdings and positions.
 
         :param strategy:Strategy; use to calculate the signal and generate SignalEvent.
+
+        :param strategy_params: dict; extra keyword arguments of the strategy, e.g. lookback windows.
+
+        :param portfolio_params: dict; extra keyword arguments of the portfolio.
+
+        :param data_handler_params: dict; extra keyword arguments of the data handler.
+
+        :param monitor: MemoryMonitor; accounts the memory of the components at checkpoints, None for no accounting.
         """
 
         self.csv_dir = csv_dir
@@ -49,6 +58,9 @@ class Backtest(object):
         self.execution_handler_cls = execution_handler
         self.portfolio_cls = portfolio
         self.strategy_cls = strategy
+        self.strategy_params = strategy_params or {}
+        self.portfolio_params = portfolio_params or {}
+        self.data_handler_params = data_handler_params or {}
 
         self.events = queue.Queue()
 
@@ -57,7 +69,12 @@ class Backtest(object):
         self.fills = 0
         self.num_strats = 1
 
+        self.monitor = monitor
+        if self.monitor is not None:
+            self.monitor.start(self)
         self._generate_trading_instances()
+        if self.monitor is not None:
+            self.monitor.checkpoint('start')
 
     # create Datahandler,strategy,portfolio,execution
     def _generate_trading_instances(self):
@@ -67,9 +84,11 @@ class Backtest(object):
         """
 
         print("creating DataHandler,Strategy,Portfolio and ExecutionHandler")
-        self.data_handler = self.data_handler_cls(self.events, self.csv_dir, self.symbol_list)
-        self.strategy = self.strategy_cls(self.data_handler, self.events)
-        self.portfolio = self.portfolio_cls(self.data_handler, self.events, self.start_date, self.initial_capital)
+        self.data_handler = self.data_handler_cls(self.events, self.csv_dir, self.symbol_list,
+                                                  **self.data_handler_params)
+        self.strategy = self.strategy_cls(self.data_handler, self.events, **self.strategy_params)
+        self.portfolio = self.portfolio_cls(self.data_handler, self.events, self.start_date, self.initial_capital,
+                                            **self.portfolio_params)
         self.execution_handler = self.execution_handler_cls(self.events)
 
     def _run_backtest(self):
@@ -105,6 +124,8 @@ class Backtest(object):
                         elif event.type == 'FILL':
                             self.fills += 1
                             self.portfolio.update_fill(event)
+            if self.monitor is not None:
+                self.monitor.on_bar(i)
             time.sleep(self.heartbeat)
 
     def _output_performance(self):
@@ -124,10 +145,29 @@ class Backtest(object):
         print("Signal: %s" % self.signals)
         print("Orders: %s" % self.orders)
         print("Fills: %s" % self.fills)
+        return stats
+
+    def close(self):
+        """
+        stop the thread pool of the strategy and close the fill journal of the portfolio,
+        called when the run ends, also if it fails
+        """
+        for component in (self.strategy, self.portfolio):
+            close = getattr(component, 'close', None)
+            if close is not None:
+                close()
 
     def simulate_trading(self):
         """
         Simulates the backtest and outputs portfolio performance.
+
+        :return: list; summary stats of the portfolio.
         """
-        self._run_backtest()
-        self._output_performance()
+        try:
+            self._run_backtest()
+            stats = self._output_performance()
+        finally:
+            self.close()
+        if self.monitor is not None:
+            self.monitor.checkpoint('end')
+        return stats
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of backtest results.
+
+A result is keyed by a hash of the csv files, the strategy class source, all parameters
+(objects by their class and constructor parameters), the date range, the initial capital
+and ENGINE_VERSION. The equity curve and summary stats are pickled into one file per key,
+and the least recently used files are evicted once the cache grows over max_bytes.
+"""
+
+from __future__ import print_function
+
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# bump when a change of the engine alters backtest results, so that stale results are not reused
+ENGINE_VERSION = '3'
+
+
+def _constructor_params(obj):
+    """
+    the constructor parameters of obj, read back from the attributes of the same name.
+    The state the object builds up while it is used (estimates, reports) is not part of it.
+
+    :return: dict; key: parameter name; value: its value
+    """
+    params = {}
+    for klass in inspect.getmro(type(obj)):
+        init = vars(klass).get('__init__')
+        if init is None or klass is object:
+            continue
+        try:
+            signature = inspect.signature(init)
+        except (TypeError, ValueError):
+            continue
+        for name, p in list(signature.parameters.items())[1:]:
+            if p.kind in (p.VAR_POSITIONAL, p.VAR_KEYWORD) or name in params:
+                continue
+            if not hasattr(obj, name):
+                raise ValueError("%s does not keep its parameter %s, it cannot be part of a cache key"
+                                 % (type(obj).__name__, name))
+            params[name] = getattr(obj, name)
+    return params
+
+
+def _describe(obj):
+    """
+    a deterministic, json serializable description of a parameter value
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [_describe(v) for v in obj]
+    if isinstance(obj, dict):
+        return dict((str(k), _describe(v)) for k, v in obj.items())
+    if inspect.isclass(obj):
+        return '%s.%s' % (obj.__module__, obj.__name__)
+    if isinstance(obj, np.generic):
+        return _describe(obj.item())
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return {'shape': list(obj.shape), 'values': _describe(obj.tolist())}
+        digest = hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest()
+        return {'dtype': str(obj.dtype), 'shape': list(obj.shape), 'sha256': digest}
+    if isinstance(obj, (pd.Index, pd.Series, pd.DataFrame)):
+        columns = list(obj.columns) if isinstance(obj, pd.DataFrame) else getattr(obj, 'name', None)
+        return {'class': _describe(type(obj)), 'columns': _describe(columns),
+                'rows': _describe(pd.util.hash_pandas_object(obj).values)}
+    if hasattr(obj, '__dict__'):
+        return {'class': _describe(type(obj)), 'params': _describe(_constructor_params(obj))}
+    return repr(obj)
+
+
+class ResultCache(object):
+    """
+    ResultCache stores equity curves and summary stats of backtests on disk.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        """
+        :param cache_dir: string; directory of the cache files, created if missing
+
+        :param max_bytes: int; the cache is trimmed to this size after every put()
+
+        :param hits: int; number of get() calls answered from the cache
+
+        :param misses: int; number of get() calls not found in the cache
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes = {}
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _hash_file(self, path):
+        """
+        sha256 of a file, memoized on (path, size, mtime)
+        """
+        st = os.stat(path)
+        memo_key = (path, st.st_size, st.st_mtime)
+        if memo_key not in self._file_hashes:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            self._file_hashes[memo_key] = h.hexdigest()
+        return self._file_hashes[memo_key]
+
+    def make_key(self, csv_dir, symbol_list, strategy, start_date, initial_capital, **params):
+        """
+        hash everything the result of a backtest depends on
+
+        :param csv_dir: string; head root of CSV data.
+
+        :param symbol_list: list; a list of symbol strings.
+
+        :param strategy: class; the Strategy class, its source code is part of the key
+
+        :param start_date: datetime; start datetime of the strategy.
+
+        :param initial_capital: float; The starting capital for the portfolio
+
+        :param params: other keyword arguments of the Backtest, e.g. strategy_params and data_handler_params
+
+        :return: string; hex digest of the inputs
+        """
+        try:
+            source = inspect.getsource(strategy)
+        except (IOError, TypeError):
+            source = _describe(strategy)
+        data = [(s, self._hash_file(os.path.join(csv_dir, '%s.csv' % s))) for s in symbol_list]
+        inputs = {
+            'engine': ENGINE_VERSION,
+            'data': data,
+            'strategy': _describe(strategy),
+            'source': source,
+            'start_date': str(start_date),
+            'initial_capital': float(initial_capital),
+            'params': _describe(params),
+        }
+        text = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '%s.pkl' % key)
+
+    def get(self, key):
+        """
+        :param key: string; key from make_key()
+
+        :return: (DataFrame, list); equity curve and summary stats, None if the key is not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(path, None)  # mark as recently used
+        self.hits += 1
+        return result['equity_curve'], result['stats']
+
+    def put(self, key, equity_curve, stats):
+        """
+        store a result, then evict the least recently used results over max_bytes
+
+        :param key: string; key from make_key()
+
+        :param equity_curve: DataFrame; Portfolio.equity_curve
+
+        :param stats: list; summary stats of Portfolio.output_summary_stats()
+        """
+        path = self._path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'equity_curve': equity_curve, 'stats': stats}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # atomic, a concurrent get() sees the old or the new file
+        self.evict()
+
+    def evict(self):
+        """
+        remove the least recently used results until the cache is not larger than max_bytes
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                st = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        entries.sort()
+        size = sum(e[1] for e in entries)
+        for mtime, nbytes, name in entries:
+            if size <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            size -= nbytes
+
+
+def cached_backtest(cache, csv_dir, symbol_list, initial_capital, start_date, data_handler, execution_handler,
+                    portfolio, strategy, heartbeat=0.0, **params):
+    """
+    return the cached result of a backtest, or simulate it and cache the result
+
+    :param cache: ResultCache; the cache
+
+    :param params: keyword arguments of Backtest, e.g. strategy_params, portfolio_params
+
+    :return: (DataFrame, list, boolean); equity curve, summary stats and whether it was a cache hit
+    """
+    if (params.get('portfolio_params') or {}).get('journal') is not None:
+        raise ValueError("a cached result has no fills to journal, run without the cache to record a fill journal")
+    key = cache.make_key(csv_dir, symbol_list, strategy, start_date, initial_capital,
+                         data_handler=data_handler, execution_handler=execution_handler, portfolio=portfolio,
+                         **params)
+    result = cache.get(key)
+    if result is not None:
+        return result[0], result[1], True
+
+    from backtest import Backtest
+    backtest = Backtest(csv_dir, symbol_list, initial_capital, heartbeat, start_date, data_handler,
+                        execution_handler, portfolio, strategy, **params)
+    stats = backtest.simulate_trading()
+    cache.put(key, backtest.portfolio.equity_curve, stats)
+    return backtest.portfolio.equity_curve, stats, False
+
+
+def parameter_grid(grid):
+    """
+    expand a dict of parameter lists into a list of parameter dicts
+
+    :param grid: dict; key: parameter name; value: list of values
+
+    :return: list of dict; every combination of the values
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[n] for n in names])]
+
+
+def run_sweep(cache, param_grid, **backtest_kwargs):
+    """
+    run a backtest for every strategy parameter combination, only combinations missing from the cache are simulated
+
+    :param cache: ResultCache; the cache
+
+    :param param_grid: dict or list; a dict of parameter lists, or a list of strategy_params dicts
+
+    :param backtest_kwargs: keyword arguments of cached_backtest() except strategy_params
+
+    :return: list; (strategy_params, equity curve, summary stats) of every combination
+    """
+    if isinstance(param_grid, dict):
+        param_grid = parameter_grid(param_grid)
+
+    portfolio_params = dict(backtest_kwargs.pop('portfolio_params', None) or {})
+    portfolio_params.setdefault('output_path', None)
+
+    results = []
+    computed = 0
+    for strategy_params in param_grid:
+        equity_curve, stats, hit = cached_backtest(cache, strategy_params=strategy_params,
+                                                   portfolio_params=portfolio_params, **backtest_kwargs)
+        computed += not hit
+        results.append((strategy_params, equity_curve, stats))
+    print("sweep: %d combinations, %d computed, %d from cache" %
+          (len(param_grid), computed, len(param_grid) - computed))
+    return results
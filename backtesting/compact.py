@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Compact in-memory representation of the (bars x symbols) bar columns.
+
+A column can be held as float32, as fixed-point integer ticks with a tick size per symbol,
+as a dictionary of its distinct values (e.g. a constant volume), or as small integer deltas
+in ticks with an absolute anchor every few bars. Indexing a compact column decodes the
+requested bars to float64, so the data handler reads it as it reads an ndarray.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+PRICE_FIELDS = ['open', 'high', 'low', 'close', 'adj_close']
+# the largest relative error the 'auto' policy accepts
+AUTO_TOLERANCE = 1e-6
+
+
+def _smallest_int(low, high, dtypes=(np.int8, np.int16, np.int32, np.int64)):
+    for dtype in dtypes:
+        info = np.iinfo(dtype)
+        if info.min < low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def _tick_factors(tick_sizes):
+    """
+    value = ticks * multiplier / divisor. A tick size like 0.01 decodes as ticks / 100, which gives the
+    same float as the decimal price in the csv, where ticks * 0.01 may be one ulp off.
+
+    :return: (ndarray, ndarray); multiplier and divisor of every symbol
+    """
+    tick_sizes = np.asarray(tick_sizes, dtype=np.float64)
+    inverse = np.round(1.0 / tick_sizes)
+    fraction = (tick_sizes < 1.0) & (np.abs(inverse * tick_sizes - 1.0) < 1e-12)
+    return np.where(fraction, 1.0, tick_sizes), np.where(fraction, inverse, 1.0)
+
+
+def _scalar(values):
+    return values[()] if np.ndim(values) == 0 else values
+
+
+class CompactColumn(object):
+    """
+    CompactColumn is the base class of the encoded columns, indexed like a (bars x symbols) ndarray.
+    """
+    codec = None
+
+    def __init__(self, shape):
+        """
+        :param shape: tuple; (bars, symbols)
+        """
+        self.shape = shape
+        self.ndim = 2
+        self.dtype = np.dtype(np.float64)
+
+    def _decode(self, rows, cols):
+        """
+        :param rows: int, slice or array; bars to decode
+
+        :param cols: int, slice or array; symbols to decode
+
+        :return: ndarray; float64 values
+        """
+        raise NotImplementedError("should implement _decode()")
+
+    @property
+    def nbytes(self):
+        """
+        :return: int; bytes of the encoded arrays
+        """
+        return sum(getattr(self, name).nbytes for name in self._arrays if getattr(self, name) is not None)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows, cols = (tuple(key) + (slice(None),))[:2]
+        return self._decode(rows, cols)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        values = self.decode()
+        return values if dtype is None else values.astype(dtype)
+
+    def decode(self):
+        """
+        :return: ndarray; the whole column as float64
+        """
+        return self._decode(slice(None), slice(None))
+
+
+class Float32Column(CompactColumn):
+    """
+    the column rounded to float32
+    """
+    codec = 'float32'
+    _arrays = ('values',)
+
+    def __init__(self, values):
+        super(Float32Column, self).__init__(values.shape)
+        self.values = values.astype(np.float32)
+
+    def _decode(self, rows, cols):
+        return _scalar(np.asarray(self.values[rows, cols], dtype=np.float64))
+
+
+class TickColumn(CompactColumn):
+    """
+    the column as integer ticks, value = ticks * tick size of the symbol
+    """
+    codec = 'ticks'
+    _arrays = ('ticks', 'multipliers', 'divisors')
+
+    def __init__(self, values, tick_sizes):
+        """
+        :param values: ndarray; bars x symbols
+
+        :param tick_sizes: ndarray; tick size of every symbol
+        """
+        super(TickColumn, self).__init__(values.shape)
+        self.multipliers, self.divisors = _tick_factors(tick_sizes)
+        missing = np.isnan(values)
+        ticks = np.round(np.where(missing, 0.0, values) * self.divisors / self.multipliers)
+        dtype = _smallest_int(ticks.min() if ticks.size else 0, ticks.max() if ticks.size else 0,
+                              (np.int32, np.int64))
+        self.na = np.iinfo(dtype).min
+        self.ticks = ticks.astype(dtype)
+        self.ticks[missing] = self.na
+
+    def _decode(self, rows, cols):
+        ticks = self.ticks[rows, cols]
+        values = ticks * self.multipliers[cols] / self.divisors[cols]
+        return _scalar(np.where(ticks == self.na, np.nan, values))
+
+
+class DictionaryColumn(CompactColumn):
+    """
+    the column as codes into the sorted array of its distinct values
+    """
+    codec = 'dictionary'
+    _arrays = ('codes', 'dictionary')
+
+    def __init__(self, values):
+        super(DictionaryColumn, self).__init__(values.shape)
+        self.dictionary, codes = np.unique(values, return_inverse=True)
+        dtype = np.uint8 if len(self.dictionary) <= 1 << 8 else np.uint16 if len(self.dictionary) <= 1 << 16 \
+            else np.uint32
+        self.codes = codes.reshape(values.shape).astype(dtype)
+
+    def _decode(self, rows, cols):
+        return _scalar(self.dictionary[self.codes[rows, cols]])
+
+
+class DeltaColumn(CompactColumn):
+    """
+    the column as tick differences between consecutive bars, with the absolute ticks every anchor_every bars.
+    A bar is decoded from the anchor before it.
+    """
+    codec = 'delta'
+    _arrays = ('deltas', 'anchors', 'multipliers', 'divisors', 'missing')
+
+    def __init__(self, values, tick_sizes, anchor_every=64):
+        """
+        :param values: ndarray; bars x symbols
+
+        :param tick_sizes: ndarray; tick size of every symbol
+
+        :param anchor_every: int; bars between two absolute anchors
+        """
+        super(DeltaColumn, self).__init__(values.shape)
+        self.multipliers, self.divisors = _tick_factors(tick_sizes)
+        self.anchor_every = anchor_every
+        missing = np.isnan(values)
+        self.missing = missing if missing.any() else None
+        ticks = np.round(np.where(missing, 0.0, values) * self.divisors / self.multipliers).astype(np.int64)
+        deltas = np.zeros_like(ticks)
+        deltas[1:] = ticks[1:] - ticks[:-1]
+        self.deltas = deltas.astype(_smallest_int(deltas.min() if deltas.size else 0,
+                                                  deltas.max() if deltas.size else 0))
+        self.anchors = ticks[::anchor_every].copy()
+
+    def _decode(self, rows, cols):
+        positions = np.arange(self.shape[0])[rows]
+        if positions.size == 0:
+            return np.empty(positions.shape + np.empty(self.shape[1])[cols].shape)
+        first, last = positions.min(), positions.max()
+        block = first // self.anchor_every
+        start = block * self.anchor_every
+        ticks = np.cumsum(self.deltas[start:last + 1], axis=0, dtype=np.int64)
+        ticks += self.anchors[block] - ticks[0]
+        if isinstance(rows, slice):
+            ticks = ticks[positions - start][:, cols]
+        else:
+            ticks = ticks[positions - start, cols]
+        values = ticks * self.multipliers[cols] / self.divisors[cols]
+        if self.missing is not None:
+            values = np.where(self.missing[rows, cols], np.nan, values)
+        return _scalar(np.asarray(values, dtype=np.float64))
+
+
+def _tick_array(tick_sizes, symbol_list):
+    """
+    :return: ndarray; tick size of every symbol, None if a symbol has none
+    """
+    if tick_sizes is None:
+        return None
+    if isinstance(tick_sizes, dict):
+        if any(s not in tick_sizes for s in symbol_list):
+            return None
+        return np.array([tick_sizes[s] for s in symbol_list], dtype=np.float64)
+    return np.full(len(symbol_list), float(tick_sizes))
+
+
+def encode_column(values, codec, tick_sizes=None):
+    """
+    :param values: ndarray; bars x symbols float64 values
+
+    :param codec: string; 'float64', 'float32', 'ticks', 'dictionary', 'delta', or 'auto' for the smallest codec
+        whose relative error is within AUTO_TOLERANCE (the exact one if it is at most 5% larger)
+
+    :param tick_sizes: ndarray; tick size of every symbol, needed by 'ticks' and 'delta'
+
+    :return: ndarray or CompactColumn; the encoded column
+    """
+    if codec == 'float64':
+        return values
+    if codec == 'float32':
+        return Float32Column(values)
+    if codec == 'dictionary':
+        return DictionaryColumn(values)
+    if codec in ('ticks', 'delta'):
+        if tick_sizes is None:
+            raise ValueError("the %s codec needs a tick size for every symbol" % codec)
+        return TickColumn(values, tick_sizes) if codec == 'ticks' else DeltaColumn(values, tick_sizes)
+    if codec != 'auto':
+        raise ValueError("unknown column codec: %s" % codec)
+
+    candidates = [Float32Column(values)]
+    if len(np.unique(values)) <= 1 << 16:
+        candidates.append(DictionaryColumn(values))
+    if tick_sizes is not None:
+        candidates.append(TickColumn(values, tick_sizes))
+        candidates.append(DeltaColumn(values, tick_sizes))
+    # the smallest codec within the tolerance, an exact codec wins over one up to 5% smaller
+    scored = [(column.nbytes, column_error(values, column)[1], column) for column in candidates]
+    scored = [(nbytes, error, column) for nbytes, error, column in scored
+              if error <= AUTO_TOLERANCE and nbytes < values.nbytes]
+    if not scored:
+        return values
+    smallest = min(nbytes for nbytes, error, column in scored)
+    return min([c for c in scored if c[0] <= 1.05 * smallest], key=lambda c: (c[1], c[0]))[2]
+
+
+def column_error(values, column):
+    """
+    :param values: ndarray; the float64 values
+
+    :param column: ndarray or CompactColumn; the encoded column
+
+    :return: (float, float); largest absolute and relative error of the decoded values
+    """
+    decoded = np.asarray(column, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = np.abs(decoded - values)
+        relative = error / np.abs(values)
+    both_nan = np.isnan(values) & np.isnan(decoded)
+    error[both_nan] = 0.0
+    relative[both_nan | (error == 0)] = 0.0
+    if error.size == 0:
+        return 0.0, 0.0
+    return float(np.nanmax(error)) if not np.isnan(error).all() else np.nan, \
+        float(np.nanmax(relative)) if not np.isnan(relative).all() else np.nan
+
+
+def compact_columns(bar_columns, symbol_list, column_policy, tick_sizes=None, lot_size=1.0):
+    """
+    encode the bar columns of a data handler
+
+    :param bar_columns: dict; key: column name; value: ndarray (bars x symbols) float64
+
+    :param symbol_list: list; a list of symbol strings, the column order of the arrays
+
+    :param column_policy: string or dict; codec of the price columns, or key: column name; value: codec
+        (see encode_column). The volume and columns missing from the dict are kept as float64
+
+    :param tick_sizes: float or dict; tick size of the prices, for all symbols or key: symbol; value: tick size
+
+    :param lot_size: float; tick size of the volume, when the dict names a codec for it
+
+    :return: dict; key: column name; value: ndarray or CompactColumn
+    """
+    prices = _tick_array(tick_sizes, symbol_list)
+    volume = np.full(len(symbol_list), float(lot_size))
+    columns = {}
+    for f, values in bar_columns.items():
+        if isinstance(column_policy, dict):
+            codec = column_policy.get(f, 'float64')
+        else:
+            codec = column_policy if f in PRICE_FIELDS else 'float64'
+        columns[f] = encode_column(values, codec, prices if f in PRICE_FIELDS else volume)
+    return columns
+
+
+def column_report(bar_columns, compact):
+    """
+    compare the encoded columns with the float64 columns
+
+    :param bar_columns: dict; key: column name; value: ndarray (bars x symbols) float64
+
+    :param compact: dict; the encoded columns of compact_columns()
+
+    :return: DataFrame; codec, float64 and encoded bytes, max absolute and relative error of every column
+    """
+    rows = []
+    for f, values in bar_columns.items():
+        column = compact[f]
+        abs_error, rel_error = column_error(values, column)
+        rows.append((f, getattr(column, 'codec', None) or 'float64', values.nbytes, column.nbytes,
+                     abs_error, rel_error))
+    report = pd.DataFrame(rows, columns=['column', 'codec', 'raw_bytes', 'bytes', 'max_abs_error', 'max_rel_error'])
+    return report.set_index('column')
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Commission and slippage models of a fill.
+"""
+
+from __future__ import print_function
+
+from abc import ABCMeta, abstractmethod
+
+
+class CommissionModel(object):
+    """
+    CommissionModel is an abstract class that provides an interface for all commission models.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def calculate(self, quantity, price):
+        """
+        :param quantity: int; no-negative filled quantity
+
+        :param price: float; fill price
+
+        :return: float; the fees of trading
+        """
+        raise NotImplementedError("should implement calculate()")
+
+
+class IBCommission(CommissionModel):
+    """
+    Interactive Brokers fixed tiered fees, the default of FillEvent
+    """
+
+    def calculate(self, quantity, price=None):
+        if quantity <= 500:
+            return max(1.3, 0.013 * quantity)
+        return max(1.3, 0.008 * quantity)
+
+
+class FixedCommission(CommissionModel):
+    """
+    the same fee for every fill
+    """
+
+    def __init__(self, cost=1.0):
+        """
+        :param cost: float; fee of a fill
+        """
+        self.cost = cost
+
+    def calculate(self, quantity, price):
+        return self.cost
+
+
+class PerShareCommission(CommissionModel):
+    """
+    a fee per unit with a minimum per fill
+    """
+
+    def __init__(self, per_share=0.005, minimum=1.0):
+        """
+        :param per_share: float; fee of one unit
+
+        :param minimum: float; minimum fee of a fill
+        """
+        self.per_share = per_share
+        self.minimum = minimum
+
+    def calculate(self, quantity, price):
+        return max(self.minimum, self.per_share * quantity)
+
+
+class PercentCommission(CommissionModel):
+    """
+    a fee proportional to the traded value
+    """
+
+    def __init__(self, bps=10.0, minimum=0.0):
+        """
+        :param bps: float; fee in basis points of quantity * price
+
+        :param minimum: float; minimum fee of a fill
+        """
+        self.bps = bps
+        self.minimum = minimum
+
+    def calculate(self, quantity, price):
+        return max(self.minimum, quantity * price * self.bps / 10000.0)
+
+
+class SlippageModel(object):
+    """
+    SlippageModel is an abstract class that provides an interface for all slippage models.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def fill_price(self, direction, quantity, price):
+        """
+        :param direction: int; 1 for BUY, -1 for SELL
+
+        :param quantity: int; no-negative filled quantity
+
+        :param price: float; price of the bar
+
+        :return: float; the price the order is filled at
+        """
+        raise NotImplementedError("should implement fill_price()")
+
+
+class NoSlippage(SlippageModel):
+    """
+    fills at the price of the bar
+    """
+
+    def fill_price(self, direction, quantity, price):
+        return price
+
+
+class BpsSlippage(SlippageModel):
+    """
+    fills a fixed number of basis points worse than the price of the bar
+    """
+
+    def __init__(self, bps=5.0):
+        """
+        :param bps: float; slippage in basis points of the price
+        """
+        self.bps = bps
+
+    def fill_price(self, direction, quantity, price):
+        return price * (1.0 + direction * self.bps / 10000.0)
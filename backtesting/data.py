@@ -7,6 +7,7 @@ Created on Tue Mar 28 20:59:55 2017
 
 from __future__ import print_function
 
+import copy
 import datetime
 import os
 import os.path
@@ -18,6 +19,19 @@ import pandas as pd
 from event import MarketEvent
 
 
+def to_epoch_ns(t):
+    """
+    convert a point in time to int64 epoch nanoseconds
+
+    :param t: int, datetime, Timestamp, datetime64 or string; int is taken as epoch nanoseconds
+
+    :return: int; epoch nanoseconds
+    """
+    if isinstance(t, (int, np.integer)):
+        return int(t)
+    return pd.Timestamp(t).value
+
+
 class DataHandler(object):
     """
     DataHandler is an abstract class that provides an interface for all data handlers
@@ -58,6 +72,47 @@ class DataHandler(object):
         """
         raise NotImplementedError("should implement get_latest_bar_datetime()")
 
+    @abstractmethod
+    def get_latest_bar_time(self, symbol):
+        """
+        return time of latest bar as int64 epoch nanoseconds
+
+        :param symbol: string; the ticker symbol
+
+        :return: int; epoch nanoseconds of latest bar
+        """
+        raise NotImplementedError("should implement get_latest_bar_time()")
+
+    @abstractmethod
+    def get_bar_asof(self, symbol, t):
+        """
+        return the latest bar at or before time t
+
+        :param symbol: string; the ticker symbol
+
+        :param t: int or datetime; epoch nanoseconds or anything pandas can convert
+
+        :return: (int, ndarray); epoch nanoseconds and values of the bar (ordered as fields), None if there is none
+        """
+        raise NotImplementedError("should implement get_bar_asof()")
+
+    @abstractmethod
+    def get_bars_values_between(self, symbol, val_type, t0, t1):
+        """
+        return the values of the bars between time t0 and t1 (both included)
+
+        :param symbol: string; the ticker symbol
+
+        :param val_type: string, one of column names
+
+        :param t0: int or datetime; start, epoch nanoseconds or anything pandas can convert
+
+        :param t1: int or datetime; end, epoch nanoseconds or anything pandas can convert
+
+        :return: (ndarray, ndarray); epoch nanoseconds and values of the bars
+        """
+        raise NotImplementedError("should implement get_bars_values_between()")
+
     @abstractmethod
     def get_latest_bar_value(self, symbol, val_type):
         """
@@ -86,6 +141,41 @@ class DataHandler(object):
         """
         raise NotImplementedError("should implement get_latest_bars_values()")
 
+    @abstractmethod
+    def get_latest_symbols_value(self, val_type):
+        """
+        returns the value of the latest bar of every symbol in one call
+
+        :param val_type: string, one of column names
+
+        :return: ndarray; values of the latest bars, ordered as symbol_list
+        """
+        raise NotImplementedError("should implement get_latest_symbols_value()")
+
+    @abstractmethod
+    def get_latest_symbols_bars_values(self, val_type, N=1):
+        """
+        returns the values of the latest bars of every symbol in one call
+
+        :param val_type: string, one of column names
+
+        :param N: int; the number of the bars
+
+        :return: ndarray; symbols x N values, rows ordered as symbol_list, oldest bar first
+        """
+        raise NotImplementedError("should implement get_latest_symbols_bars_values()")
+
+    @abstractmethod
+    def get_latest_symbols_bar(self, val_types=None):
+        """
+        returns several values of the latest bar of every symbol in one call
+
+        :param val_types: list; column names, None for all columns
+
+        :return: ndarray; symbols x val_types values, rows ordered as symbol_list
+        """
+        raise NotImplementedError("should implement get_latest_symbols_bar()")
+
     @abstractmethod
     def update_bars(self):
         """
@@ -95,7 +185,8 @@ class DataHandler(object):
 
 
 class HistoricCSVDataHandler(DataHandler):
-    def __init__(self, events, csv_dir, symbol_list):
+    def __init__(self, events, csv_dir, symbol_list, start_date=None, end_date=None, preprocessor=None,
+                 column_policy=None, tick_sizes=None, lot_size=1.0, validate_columns=False, calendar=None):
         """
 
         :param events: Queue; the Events Queue
@@ -104,102 +195,260 @@ class HistoricCSVDataHandler(DataHandler):
 
         :param symbol_list: list; a list of symbol strings
 
-        :param symbol_data: dict; key: symbol value: A generator that iterates over the rows of the frame (each one is a tuple [0]: index(datetime); [1]:values)
+        :param start_date: datetime; bars before it are dropped, None to keep all
+
+        :param end_date: datetime; bars after it are dropped, None to keep all
+
+        :param preprocessor: Preprocessor; checks and cleans the csv data before the backtest, None to read it as is
+
+        :param column_policy: string or dict; compact codec of the price columns or key: column name; value: codec
+            ('float64', 'float32', 'ticks', 'dictionary', 'delta' or 'auto'), None to keep float64 ndarrays.
+            The volume is compacted only when the dict names it
+
+        :param tick_sizes: float or dict; price tick size of all symbols or key: symbol; value: tick size,
+            used by the 'ticks' and 'delta' codecs
+
+        :param lot_size: float; tick size of the volume, used by the 'ticks' and 'delta' codecs
 
-        :param latest_symbol_data: dict; key: string; value: a list of rows from symbol_data rows
+        :param validate_columns: boolean; compare the compact columns with the float64 ones into column_report
+
+        :param calendar: DatetimeIndex; bars of all symbols are aligned on it (also by the preprocessor),
+            None to use the union of the symbol indexes
+
+        :param preprocess_report: DataFrame; issues found by the preprocessor
+
+        :param column_report: DataFrame; codec, bytes and max precision error of every column, None unless validated
+
+        :param symbol_index: dict; key: symbol; value: position of the symbol in symbol_list
+
+        :param fields: list; column names of the bars
+
+        :param bar_index: DatetimeIndex; the combined datetime index of all symbols
+
+        :param bar_times: ndarray; bar_index as int64 epoch nanoseconds
+
+        :param bar_columns: dict; key: column name; value: ndarray or CompactColumn (bars x symbols) of the column
+
+        :param bar_cursor: int; number of bars already delivered by update_bars(), the latest bars are
+            read from bar_columns up to it, so no copy of the delivered bars is kept
 
         :param continue_backtest: boolean; determine if updating new bar
         """
         self.events = events
         self.csv_dir = csv_dir
         self.symbol_list = symbol_list
-        self.symbol_data = {}
-        self.latest_symbol_data = {}
+        self.start_date = start_date
+        self.end_date = end_date
+        self.preprocessor = preprocessor
+        self.preprocess_report = None
+        self.column_policy = column_policy
+        self.tick_sizes = tick_sizes
+        self.lot_size = lot_size
+        self.validate_columns = validate_columns
+        self.calendar = calendar
+        self.column_report = None
+        self.symbol_index = dict((s, i) for i, s in enumerate(self.symbol_list))
+        self.fields = ['open', 'high', 'low', 'close', 'volume', 'adj_close']
+        self.bar_index = None
+        self.bar_times = None
+        self.bar_columns = {}
+        self.bar_cursor = 0
         self.continue_backtest = True
 
         self._open_convert_csv_files()
+        if self.column_policy is not None:
+            self._compact_columns()
 
     def _open_convert_csv_files(self):
         """
-        read csv data into DataFrame, and generate symbol_data
+        read csv data into DataFrame and align all symbols on the combined index into bar_columns
         """
+        if self.preprocessor is not None:
+            self._load_preprocessed()
+            return
+
+        frames = {}
         comb_index = None
         for s in self.symbol_list:
-            self.symbol_data[s] = pd.io.parsers.read_csv(os.path.join(self.csv_dir, '%s.csv' % s),
-                                                         header=0, index_col=0, parse_dates=True,
-                                                         names=[
-                                                             'datetime', 'open', 'high', 'low', 'close', 'volume',
-                                                             'adj_close'])
+            frames[s] = pd.io.parsers.read_csv(os.path.join(self.csv_dir, '%s.csv' % s),
+                                               header=0, index_col=0, parse_dates=True,
+                                               names=['datetime'] + self.fields)
 
             if comb_index is None:  # 联合index给dataframe下一个数据
-                comb_index = self.symbol_data[s].index
+                comb_index = frames[s].index
             else:
-                comb_index.union(self.symbol_data[s].index)
+                comb_index = comb_index.union(frames[s].index)
+        if self.calendar is not None:
+            comb_index = pd.DatetimeIndex(self.calendar)
 
-            self.latest_symbol_data[s] = []
+        if self.start_date is not None:
+            comb_index = comb_index[comb_index >= pd.Timestamp(self.start_date)]
+        if self.end_date is not None:
+            comb_index = comb_index[comb_index <= pd.Timestamp(self.end_date)]
 
         for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method='pad').iterrows()
+            frames[s] = frames[s].reindex(index=comb_index, method='pad')
 
-    def _get_new_bar(self, symbol):
+        self.bar_index = comb_index
+        self.bar_times = np.array(comb_index.asi8, dtype=np.int64)
+        for f in self.fields:
+            self.bar_columns[f] = np.column_stack([frames[s][f].values.astype(np.float64)
+                                                   for s in self.symbol_list])
+
+    def _load_preprocessed(self):
+        """
+        take bar_index and bar_columns from the preprocessor (or its cache)
+        """
+        preprocessor = self.preprocessor
+        if self.calendar is not None:
+            preprocessor = copy.copy(preprocessor)
+            preprocessor.calendar = self.calendar
+        bar_index, bar_columns, self.preprocess_report = preprocessor.load(self.csv_dir, self.symbol_list)
+
+        keep = np.ones(len(bar_index), dtype=bool)
+        if self.start_date is not None:
+            keep &= bar_index >= pd.Timestamp(self.start_date)
+        if self.end_date is not None:
+            keep &= bar_index <= pd.Timestamp(self.end_date)
+
+        self.bar_index = bar_index[keep]
+        self.bar_times = np.array(self.bar_index.asi8, dtype=np.int64)
+        for f in self.fields:
+            self.bar_columns[f] = np.ascontiguousarray(bar_columns[f][keep])
+
+    def _compact_columns(self):
+        """
+        replace bar_columns by their compact codecs, decoded transparently on indexing
+        """
+        from compact import column_report, compact_columns
+
+        compact = compact_columns(self.bar_columns, self.symbol_list, self.column_policy, self.tick_sizes,
+                                  self.lot_size)
+        if self.validate_columns:
+            self.column_report = column_report(self.bar_columns, compact)
+            print(self.column_report)
+        raw_bytes = sum(column.nbytes for column in self.bar_columns.values())
+        self.bar_columns = compact
+        print("compact columns: %d -> %d bytes" % (raw_bytes, sum(c.nbytes for c in compact.values())))
+
+    def _latest_row(self):
         """
-        illustrate the iteration of symbol_data
+        :return: int; row of the latest delivered bar in bar_columns
+        """
+        if self.bar_cursor == 0:
+            raise IndexError("no bar has been delivered yet")
+        return self.bar_cursor - 1
 
-        :param symbol: string; the ticker symbol
+    def _symbol_column(self, symbol):
+        """
+        :return: int; column of the symbol in bar_columns
+        """
+        try:
+            return self.symbol_index[symbol]
+        except KeyError:
+            print("That symbol is not available in the historical data set")
+            raise
 
+    def _bar(self, i, j):
+        """
+        :return: tuple; [0]: index(datetime); [1]: Series of the values of bar i of symbol j
         """
-        for b in self.symbol_data[symbol]:
-            yield b
+        dt = self.bar_index[i]
+        return dt, pd.Series([self.bar_columns[f][i, j] for f in self.fields], index=self.fields, name=dt)
 
     def get_latest_bar(self, symbol):
         """
-        return the latest bar from latest_symbol_data by selecting the symbol
+        return the latest bar, built from bar_columns at the cursor
 
         :param symbol: string; the ticker symbol
 
-        :return: Series; the last bar
+        :return: tuple; [0]: datetime; [1]: Series of the last bar
         """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set")
-            raise
-        else:
-            return bars_list[-1]
+        j = self._symbol_column(symbol)
+        return self._bar(self._latest_row(), j)
 
     def get_latest_bars(self, symbol, N=1):
         """
-        returns a list of bars from latest_symbol_data by selecting the symbol
+        returns a list of the latest bars, built from bar_columns up to the cursor
 
         :param symbol: string; the ticker symbol
 
         :param int; the number of the bars
 
-        :return: a list of Series; the lasted bars
+        :return: a list of tuple; [0]: datetime; [1]: Series of the lasted bars
+        """
+        j = self._symbol_column(symbol)
+        start = max(0, self.bar_cursor - N) if N > 0 else 0
+        return [self._bar(i, j) for i in range(start, self.bar_cursor)]
+
+    def get_latest_bar_datetime(self, symbol):
+        """
+        returns datetime object of latest bar
+
+        :param symbol: string; the ticker symbol
+
+        :return: datetime; datetime object of latest bar : datetime is the index of latest bar
+        """
+        self._symbol_column(symbol)
+        return self.bar_index[self._latest_row()]
+
+    def get_latest_bar_time(self, symbol):
+        """
+        returns time of latest bar as int64 epoch nanoseconds
+
+        :param symbol: string; the ticker symbol
+
+        :return: int; epoch nanoseconds of latest bar
+        """
+        if symbol not in self.symbol_index:
+            print("That symbol is not available in the historical data set")
+            raise KeyError(symbol)
+        return int(self.bar_times[self._latest_row()])
+
+    def get_bar_asof(self, symbol, t):
+        """
+        returns the latest delivered bar at or before time t, found by binary search
+
+        :param symbol: string; the ticker symbol
+
+        :param t: int or datetime; epoch nanoseconds or anything pandas can convert
+
+        :return: (int, ndarray); epoch nanoseconds and values of the bar (ordered as fields), None if there is none
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            j = self.symbol_index[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set")
             raise
-        else:
-            return bars_list[-N:]
+        i = np.searchsorted(self.bar_times[:self.bar_cursor], to_epoch_ns(t), side='right') - 1
+        if i < 0:
+            return None
+        return int(self.bar_times[i]), np.array([self.bar_columns[f][i, j] for f in self.fields])
 
-    def get_latest_bar_datetime(self, symbol):
+    def get_bars_values_between(self, symbol, val_type, t0, t1):
         """
-        returns datetime object of latest bar
+        returns the values of the delivered bars between time t0 and t1 (both included), found by binary search
 
         :param symbol: string; the ticker symbol
 
-        :return: datetime; datetime object of latest bar : datetime is the index of latest bar
+        :param val_type: string, one of column names
+
+        :param t0: int or datetime; start, epoch nanoseconds or anything pandas can convert
+
+        :param t1: int or datetime; end, epoch nanoseconds or anything pandas can convert
+
+        :return: (ndarray, ndarray); epoch nanoseconds and values of the bars
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            j = self.symbol_index[symbol]
+            column = self.bar_columns[val_type]
         except KeyError:
-            print("That symbol is not available in the historical date set")
+            print("That symbol or column is not available in the historical data set")
             raise
-        else:
-            return bars_list[-1][0]
+        times = self.bar_times[:self.bar_cursor]
+        start = np.searchsorted(times, to_epoch_ns(t0), side='left')
+        stop = np.searchsorted(times, to_epoch_ns(t1), side='right')
+        return times[start:stop].copy(), column[start:stop, j].copy()
 
     def get_latest_bar_value(self, symbol, val_type):
         """
@@ -212,13 +461,13 @@ class HistoricCSVDataHandler(DataHandler):
 
         :return: type of value; return value of the latest bar
         """
+        j = self._symbol_column(symbol)
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            column = self.bar_columns[val_type]
         except KeyError:
-            print("That symbol is not available in the historical data set")
+            print("That column is not available in the historical data set")
             raise
-        else:
-            return getattr(bars_list[-1][1], val_type)
+        return column[self._latest_row(), j]
 
     def get_latest_bars_values(self, symbol, val_type, N=1):
         """
@@ -230,29 +479,83 @@ class HistoricCSVDataHandler(DataHandler):
 
         :param N: int; the number of the bars
 
-        :return: a list of val_type; a list of value of the lasted bars
+        :return: ndarray; values of the lasted bars, oldest first
+        """
+        j = self._symbol_column(symbol)
+        try:
+            column = self.bar_columns[val_type]
+        except KeyError:
+            print("That column is not available in the historical data set")
+            raise
+        start = max(0, self.bar_cursor - N) if N > 0 else 0
+        return np.array(column[start:self.bar_cursor, j], dtype=np.float64)
+
+    def get_latest_symbols_value(self, val_type):
+        """
+        returns the value of the latest bar of every symbol in one call
+
+        :param val_type: string, one of column names
+
+        :return: ndarray; values of the latest bars, ordered as symbol_list
         """
         try:
-            bars_list = self.get_latest_bars(symbol, N)
+            column = self.bar_columns[val_type]
         except KeyError:
-            print("The symbol is not available in the historical data set")
+            print("That column is not available in the historical data set")
             raise
         else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+            return column[self._latest_row()].copy()
+
+    def get_latest_symbols_bars_values(self, val_type, N=1):
+        """
+        returns the values of the latest bars of every symbol in one call
+
+        :param val_type: string, one of column names
+
+        :param N: int; the number of the bars, fewer are returned at the start of the backtest
+
+        :return: ndarray; C-contiguous symbols x N values, rows ordered as symbol_list, oldest bar first
+        """
+        try:
+            column = self.bar_columns[val_type]
+        except KeyError:
+            print("That column is not available in the historical data set")
+            raise
+        else:
+            start = max(0, self.bar_cursor - N)
+            return np.ascontiguousarray(column[start:self.bar_cursor].T)
+
+    def get_latest_symbols_bar(self, val_types=None):
+        """
+        returns several values of the latest bar of every symbol in one call
+
+        :param val_types: list; column names, None for all columns
+
+        :return: ndarray; C-contiguous symbols x val_types values, rows ordered as symbol_list
+        """
+        if val_types is None:
+            val_types = self.fields
+        try:
+            columns = [self.bar_columns[v] for v in val_types]
+        except KeyError:
+            print("That column is not available in the historical data set")
+            raise
+        else:
+            row = self._latest_row()
+            bar = np.empty((len(self.symbol_list), len(columns)))
+            for k, column in enumerate(columns):
+                bar[:, k] = column[row]
+            return bar
 
     def update_bars(self):
         """
-        read each row of symbol_data into latest_symbol_data
-        then, generate MarketEvent
+        deliver the next bar of every symbol by advancing bar_cursor, continue_backtest turns False
+        once all bars are delivered, then generate MarketEvent
         it's used in backtest module
 
         """
-        for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
-                self.continue_backtest = False
-            else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
+        if self.bar_cursor < len(self.bar_index):
+            self.bar_cursor += 1
+        else:
+            self.continue_backtest = False
         self.events.put(MarketEvent())
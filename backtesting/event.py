@@ -7,6 +7,8 @@ Created on Tue Mar 28 20:23:05 2017
 
 from __future__ import print_function
 
+from costs import IBCommission
+
 """
 there are four types of events which allow communication
 between different components via event queue
@@ -138,9 +140,4 @@ class FillEvent(Event):
         :return: float; the fees of trading
         """
 
-        full_cost = 1.3
-        if self.quantity <= 500:
-            full_cost = max(1.3, 0.013 * self.quantity)
-        else:
-            full_cost = max(1.3, 0.008 * self.quantity)
-        return full_cost
+        return IBCommission().calculate(self.quantity)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary journal of fills, and a replay that rebuilds holdings and the equity curve
+from the journal and bar prices under other commission and slippage models, without
+running the strategy again.
+
+usage: python journal.py fills.bin csv_dir [--commission per_share:0.005,1.0] [--slippage-bps 5]
+"""
+
+from __future__ import print_function
+
+import argparse
+import struct
+
+import numpy as np
+import pandas as pd
+
+from costs import BpsSlippage, FixedCommission, IBCommission, NoSlippage, PercentCommission, PerShareCommission
+
+MAGIC = b'IBTJ'
+VERSION = 1
+
+# bar time (epoch ns), symbol id, direction (1 BUY, -1 SELL), quantity, price, commission
+RECORD = struct.Struct('<qIbqdd')
+RECORD_DTYPE = np.dtype([('time', '<i8'), ('symbol', '<u4'), ('direction', 'i1'), ('quantity', '<i8'),
+                         ('price', '<f8'), ('commission', '<f8')])
+
+
+class FillJournal(object):
+    """
+    FillJournal appends fixed size binary records of fills to a file.
+    """
+
+    def __init__(self, path, symbol_list):
+        """
+        :param path: string; the journal file, overwritten if it exists
+
+        :param symbol_list: list; a list of symbol strings, fills refer to symbols by position in it
+        """
+        self.path = path
+        self.symbol_list = list(symbol_list)
+        self.symbol_index = dict((s, i) for i, s in enumerate(self.symbol_list))
+        self.count = 0
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._file.write(struct.pack('<HI', VERSION, len(self.symbol_list)))
+        for s in self.symbol_list:
+            name = s.encode('utf-8')
+            self._file.write(struct.pack('<H', len(name)))
+            self._file.write(name)
+
+    def record(self, time_ns, symbol, direction, quantity, price, commission):
+        """
+        append one fill
+
+        :param time_ns: int; bar time of the fill as epoch nanoseconds
+
+        :param symbol: string; the ticker symbol
+
+        :param direction: int; 1 for BUY, -1 for SELL
+
+        :param quantity: int; no-negative filled quantity
+
+        :param price: float; fill price
+
+        :param commission: float; the fees of trading
+        """
+        self._file.write(RECORD.pack(time_ns, self.symbol_index[symbol], direction, quantity, price, commission))
+        self.count += 1
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_journal(path):
+    """
+    read a journal written by FillJournal
+
+    :param path: string; the journal file
+
+    :return: (list, ndarray); the symbol list and the fill records (RECORD_DTYPE)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError("%s is not a fill journal" % path)
+    version, n_symbols = struct.unpack_from('<HI', data, 4)
+    if version != VERSION:
+        raise ValueError("unsupported journal version %s" % version)
+    offset = 10
+    symbol_list = []
+    for _ in range(n_symbols):
+        (length,) = struct.unpack_from('<H', data, offset)
+        offset += 2
+        symbol_list.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, offset=offset)
+    return symbol_list, records
+
+
+def replay(records, symbol_list, bar_index, prices, initial_capital, start_date,
+           commission_model=None, slippage_model=None):
+    """
+    rebuild the holdings and the equity curve of Portfolio from fills and bar prices.
+    As in the backtest, the holdings of a bar are marked before the fills of that bar,
+    and the last bar is marked once more.
+
+    :param records: ndarray; fill records of read_journal()
+
+    :param symbol_list: list; symbols of the records
+
+    :param bar_index: DatetimeIndex; datetime of each bar
+
+    :param prices: ndarray; bars x symbols prices used to mark the holdings
+
+    :param initial_capital: float; initial capital
+
+    :param start_date: datetime; datetime of the initial holdings
+
+    :param commission_model: CommissionModel; re-prices the fees, None keeps the recorded fees
+
+    :param slippage_model: SlippageModel; re-prices the fills, None keeps the recorded prices
+
+    :return: DataFrame; the equity curve (index: datetime, columns: symbols, cash, commission, total, returns, equity_curve)
+    """
+    n_bars, n_symbols = prices.shape
+    direction = records['direction'].astype(np.float64)
+    quantity = records['quantity']
+    price = records['price']
+    commission = records['commission']
+
+    if slippage_model is not None:
+        price = np.array([slippage_model.fill_price(d, q, p) for d, q, p in zip(direction, quantity, price)])
+    if commission_model is not None:
+        commission = np.array([commission_model.calculate(q, p) for q, p in zip(quantity, price)])
+
+    # bar of each fill, fills change the holdings from the next mark on
+    bar = np.searchsorted(bar_index.asi8, records['time'])
+    delta_positions = np.zeros((n_bars + 1, n_symbols))
+    np.add.at(delta_positions, (bar + 1, records['symbol']), direction * quantity)
+    delta_cash = np.zeros(n_bars + 1)
+    np.add.at(delta_cash, bar + 1, -(direction * price * quantity + commission))
+    delta_commission = np.zeros(n_bars + 1)
+    np.add.at(delta_commission, bar + 1, commission)
+
+    positions = np.cumsum(delta_positions, axis=0)
+    cash = initial_capital + np.cumsum(delta_cash)
+    total_commission = np.cumsum(delta_commission)
+
+    # marks: every bar, then the last bar again
+    marks = np.append(np.arange(n_bars), n_bars - 1)
+    mark_positions = np.vstack([positions[:n_bars], positions[n_bars:]])
+    mark_cash = np.append(cash[:n_bars], cash[n_bars])
+    mark_commission = np.append(total_commission[:n_bars], total_commission[n_bars])
+    market_values = mark_positions * prices[marks]
+
+    curve = pd.DataFrame(market_values, columns=symbol_list, index=bar_index[marks])
+    curve['cash'] = mark_cash
+    curve['commission'] = mark_commission
+    curve['total'] = mark_cash + market_values.sum(axis=1)
+
+    first = pd.DataFrame([dict([(s, 0.0) for s in symbol_list] +
+                               [('cash', initial_capital), ('commission', 0.0), ('total', initial_capital)])],
+                         index=pd.DatetimeIndex([start_date]))
+    curve = pd.concat([first, curve])[list(curve.columns)]
+    curve.index.name = 'datetime'
+    curve['returns'] = curve['total'].pct_change()
+    curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
+    return curve
+
+
+def parse_commission(spec):
+    """
+    :param spec: string; 'ib', 'fixed:cost', 'per_share:per_share[,minimum]' or 'percent:bps[,minimum]'
+
+    :return: CommissionModel; the model named by spec
+    """
+    name, _, args = spec.partition(':')
+    args = [float(a) for a in args.split(',') if a]
+    models = {'ib': IBCommission, 'fixed': FixedCommission, 'per_share': PerShareCommission,
+              'percent': PercentCommission}
+    try:
+        return models[name](*args)
+    except KeyError:
+        print("unknown commission model: %s" % name)
+        raise
+
+
+def main(argv=None):
+    try:
+        import Queue as queue
+    except ImportError:
+        import queue
+    from data import HistoricCSVDataHandler
+
+    parser = argparse.ArgumentParser(description="Replay a fill journal under other cost models.")
+    parser.add_argument('journal', help="journal written by the portfolio")
+    parser.add_argument('csv_dir', help="directory of the bar csv files")
+    parser.add_argument('--capital', type=float, default=100000.0, help="initial capital")
+    parser.add_argument('--commission', default=None, help="commission model, default: the recorded fees")
+    parser.add_argument('--slippage-bps', type=float, default=None, help="slippage in basis points")
+    parser.add_argument('--output', default=None, help="csv file of the equity curve")
+    args = parser.parse_args(argv)
+
+    symbol_list, records = read_journal(args.journal)
+    bars = HistoricCSVDataHandler(queue.Queue(), args.csv_dir, symbol_list)
+    commission_model = parse_commission(args.commission) if args.commission else None
+    slippage_model = BpsSlippage(args.slippage_bps) if args.slippage_bps else NoSlippage()
+    curve = replay(records, symbol_list, bars.bar_index, bars.bar_columns['adj_close'], args.capital,
+                   bars.bar_index[0], commission_model, slippage_model)
+
+    print("fills: %d" % len(records))
+    print("total return: %0.2f%%" % ((curve['equity_curve'].iloc[-1] - 1.0) * 100.0))
+    print("commission: %0.2f" % curve['commission'].iloc[-1])
+    if args.output is not None:
+        curve.to_csv(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Loop kernels of the strategy inner loop and of the rolling performance analytics.
+
+The kernels are compiled to machine code by numba when it is installed, otherwise they run as
+plain python. Both paths execute the same code, so they produce identical results.
+Set the environment variable BACKTEST_DISABLE_JIT=1 to force the python path.
+
+Only loops are kernels: a scalar helper called once per event from python is slower compiled,
+because the call into the compiled code costs more than the few operations it saves.
+"""
+
+from __future__ import print_function
+
+import os
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+JIT_ENABLED = njit is not None and not os.environ.get('BACKTEST_DISABLE_JIT')
+
+# market states of a symbol, see MovingAverageCrossStrategy.bought
+OUT = 0
+LONG = 1
+SHORT = -1
+STATE_CODES = {'OUT': OUT, 'LONG': LONG, 'SHORT': SHORT}
+STATE_NAMES = dict((v, k) for k, v in STATE_CODES.items())
+
+# SignalEvent.signal_type
+SIGNAL_NONE = 0
+SIGNAL_LONG = 1
+SIGNAL_EXIT = 3
+
+
+def jit(func):
+    """
+    compile func with numba.njit if JIT is enabled, else return it unchanged.
+    Compiled kernels release the GIL, so threads can run them in parallel.
+    The python function is always available as func.py_func.
+
+    :param func: function; a kernel only using numbers and numpy arrays
+
+    :return: function; the compiled or the python kernel
+    """
+    if JIT_ENABLED:
+        return njit(cache=True, nogil=True)(func)
+    func.py_func = func
+    return func
+
+
+@jit
+def moving_average_cross(bars, short_window, long_window, state):
+    """
+    the state machine of the moving average crossover for one symbol
+
+    :param bars: ndarray; latest prices, oldest first
+
+    :param short_window: int; lookback of the short moving average
+
+    :param long_window: int; lookback of the long moving average
+
+    :param state: int; OUT or LONG
+
+    :return: (int, int); the new state and the signal code (SIGNAL_NONE if nothing happens)
+    """
+    n = bars.shape[0]
+    if n == 0:
+        return state, SIGNAL_NONE
+
+    short_sma = 0.0
+    start = max(0, n - short_window)
+    for i in range(start, n):
+        short_sma += bars[i]
+    short_sma /= n - start
+
+    long_sma = 0.0
+    start = max(0, n - long_window)
+    for i in range(start, n):
+        long_sma += bars[i]
+    long_sma /= n - start
+
+    if short_sma > long_sma and state == OUT:
+        return LONG, SIGNAL_LONG
+    if short_sma < long_sma and state == LONG:
+        return OUT, SIGNAL_EXIT
+    return state, SIGNAL_NONE
+
+
+@jit
+def rolling_max_drawdown(values, window):
+    """
+    largest peak-to-trough fall of values inside every trailing window, in O(n).
+    The series is cut into blocks of window bars, a window spans the suffix of one block
+    and the prefix of the next, so it combines the suffix and prefix aggregates of both.
+
+    :param values: ndarray; the curve, without nan
+
+    :param window: int; bars per window
+
+    :return: ndarray; max drawdown of the window ending at each bar, nan for the first window - 1 bars
+    """
+    n = values.shape[0]
+    out = np.empty(n)
+    out[:] = np.nan
+    if window < 1 or n < window:
+        return out
+
+    prefix_max = np.empty(n)
+    prefix_min = np.empty(n)
+    prefix_dd = np.empty(n)
+    suffix_max = np.empty(n)
+    suffix_min = np.empty(n)
+    suffix_dd = np.empty(n)
+    for start in range(0, n, window):
+        stop = min(start + window, n)
+        prefix_max[start] = values[start]
+        prefix_min[start] = values[start]
+        prefix_dd[start] = 0.0
+        for j in range(start + 1, stop):
+            prefix_max[j] = max(prefix_max[j - 1], values[j])
+            prefix_min[j] = min(prefix_min[j - 1], values[j])
+            prefix_dd[j] = max(prefix_dd[j - 1], prefix_max[j] - values[j])
+        suffix_max[stop - 1] = values[stop - 1]
+        suffix_min[stop - 1] = values[stop - 1]
+        suffix_dd[stop - 1] = 0.0
+        for i in range(stop - 2, start - 1, -1):
+            suffix_max[i] = max(suffix_max[i + 1], values[i])
+            suffix_min[i] = min(suffix_min[i + 1], values[i])
+            suffix_dd[i] = max(suffix_dd[i + 1], values[i] - suffix_min[i + 1])
+
+    for t in range(window - 1, n):
+        s = t - window + 1
+        if s % window == 0:
+            out[t] = prefix_dd[t]
+        else:
+            out[t] = max(max(suffix_dd[s], prefix_dd[t]), suffix_max[s] - prefix_min[t])
+    return out
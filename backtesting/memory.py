@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Memory accounting of a backtest by component.
+
+MemoryMonitor traces allocations with tracemalloc from before the components are created.
+At every checkpoint the live allocations are attributed to the data handler, strategy,
+portfolio, execution handler or event queue by the innermost frame of their traceback
+that lies in a source file of that component; the rest is 'other'.
+
+memory_scaling() runs the same backtest over growing symbols x bars, after a discarded warm-up
+run that absorbs the one-off allocations of imports, caches and numba compilation, and
+check_scaling() fits how the held bytes grow, so a change that makes a component grow faster
+fails the check.
+
+Tracing every allocation with its traceback slows the backtest down by an order of magnitude,
+so the monitor is meant for diagnostic runs.
+
+usage: python memory.py csv_dir strategy.py:Class [--symbols 1,2,4] [--bars 250,500,1000] [--max-exponent 1.0]
+"""
+
+from __future__ import print_function
+
+import argparse
+import inspect
+import os
+import tracemalloc
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+import pandas as pd
+
+import event
+
+COMPONENTS = ['data_handler', 'strategy', 'portfolio', 'execution_handler', 'events']
+
+
+def _source_files(cls):
+    """
+    :return: set; source files of cls and its base classes
+    """
+    files = set()
+    for klass in inspect.getmro(cls):
+        if klass is object:
+            continue
+        try:
+            files.add(os.path.normcase(os.path.abspath(inspect.getsourcefile(klass))))
+        except (TypeError, OSError):
+            pass
+    return files
+
+
+class MemoryMonitor(object):
+    """
+    MemoryMonitor reports the bytes held by each component of a Backtest at checkpoints.
+    """
+
+    def __init__(self, every=100, nframe=30):
+        """
+        :param every: int; a checkpoint every this many bars, the start and the end are always checkpoints
+
+        :param nframe: int; frames of traceback stored per allocation, deep enough to reach the component code
+
+        :param records: list; (checkpoint, component, bytes) of every checkpoint
+        """
+        self.every = every
+        self.nframe = nframe
+        self.records = []
+        self._files = {}
+        self._owner = {}
+        self._started = False
+
+    def start(self, backtest):
+        """
+        start tracing, called by Backtest before it creates its components
+
+        :param backtest: Backtest; the backtest to account
+        """
+        classes = {
+            'data_handler': backtest.data_handler_cls,
+            'strategy': backtest.strategy_cls,
+            'portfolio': backtest.portfolio_cls,
+            'execution_handler': backtest.execution_handler_cls,
+        }
+        files = {}
+        for component, cls in classes.items():
+            for f in _source_files(cls):
+                files.setdefault(f, component)
+        for module in (event, queue):
+            files.setdefault(os.path.normcase(os.path.abspath(module.__file__)), 'events')
+        self._files = files
+        self._owner = {}
+        self.records = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframe)
+            self._started = True
+
+    def _component(self, traceback):
+        for frame in reversed(traceback):
+            owner = self._owner.get(frame.filename)
+            if owner is None:
+                owner = self._files.get(os.path.normcase(os.path.abspath(frame.filename)), '')
+                self._owner[frame.filename] = owner
+            if owner:
+                return owner
+        return 'other'
+
+    def checkpoint(self, label):
+        """
+        attribute the live allocations to the components
+
+        :param label: int or string; the bar number or a name of the checkpoint
+
+        :return: dict; key: component; value: bytes held
+        """
+        snapshot = tracemalloc.take_snapshot()
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        held = dict((c, 0) for c in COMPONENTS + ['other'])
+        for stat in snapshot.statistics('traceback'):
+            held[self._component(stat.traceback)] += stat.size
+        for component, size in held.items():
+            self.records.append((label, component, size))
+        return held
+
+    def on_bar(self, bar):
+        """
+        called by Backtest after the events of every bar
+        """
+        if self.every and bar % self.every == 0:
+            self.checkpoint(bar)
+
+    def stop(self):
+        """
+        stop tracing if this monitor started it
+        """
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def report(self):
+        """
+        :return: DataFrame; bytes held (index: checkpoint, columns: components)
+        """
+        frame = pd.DataFrame(self.records, columns=['checkpoint', 'component', 'bytes'])
+        report = frame.pivot_table(index='checkpoint', columns='component', values='bytes', sort=False)
+        report = report[[c for c in COMPONENTS + ['other'] if c in report.columns]]
+        report['total'] = report.sum(axis=1)
+        return report
+
+
+def memory_scaling(csv_dir, symbol_list, strategy, symbol_counts, bar_counts, start_date=None,
+                   data_handler=None, execution_handler=None, portfolio=None, warmup=True, **params):
+    """
+    bytes held at the end of backtests over growing numbers of symbols and bars
+
+    :param csv_dir: string; the path of csv data
+
+    :param symbol_list: list; symbols to take the first n of
+
+    :param strategy: Strategy; the strategy class
+
+    :param symbol_counts: list; numbers of symbols
+
+    :param bar_counts: list; numbers of bars
+
+    :param data_handler, execution_handler, portfolio: classes of Backtest, None for the defaults
+
+    :param warmup: boolean; run the smallest backtest once untraced before measuring, so that one-off
+        allocations (imports, caches, numba compilation) are not counted in the first run
+
+    :param params: keyword arguments of Backtest, e.g. strategy_params
+
+    :return: DataFrame; one row per run with symbols, bars and the bytes of every component
+    """
+    from backtest import Backtest
+    from data import HistoricCSVDataHandler
+    from excaution import SimulatedExecutionHandler
+    from portfolio import Portfolio
+
+    data_handler = data_handler or HistoricCSVDataHandler
+    index = data_handler(queue.Queue(), csv_dir, symbol_list[:max(symbol_counts)],
+                         **(params.get('data_handler_params') or {})).bar_index
+    portfolio_params = dict(params.pop('portfolio_params', None) or {})
+    portfolio_params['output_path'] = None
+
+    def run(n_symbols, n_bars, monitor):
+        data_handler_params = dict(params.get('data_handler_params') or {})
+        data_handler_params['end_date'] = index[min(n_bars, len(index)) - 1]
+        kwargs = dict(params, data_handler_params=data_handler_params, portfolio_params=portfolio_params)
+        backtest = Backtest(csv_dir, symbol_list[:n_symbols], 100000.0, 0.0, start_date or index[0],
+                            data_handler, execution_handler or SimulatedExecutionHandler,
+                            portfolio or Portfolio, strategy, monitor=monitor, **kwargs)
+        backtest.simulate_trading()
+
+    if warmup:
+        run(min(symbol_counts), min(bar_counts), None)
+
+    rows = []
+    for n_symbols in symbol_counts:
+        for n_bars in bar_counts:
+            monitor = MemoryMonitor(every=0)
+            run(n_symbols, n_bars, monitor)
+            monitor.stop()
+            held = monitor.report().iloc[-1]
+            rows.append(dict([('symbols', n_symbols), ('bars', min(n_bars, len(index)))] + list(held.items())))
+    return pd.DataFrame(rows)
+
+
+def check_scaling(results, max_exponent=1.0, max_bytes_per_bar=None, min_bytes=64 * 1024):
+    """
+    fit bytes ~ (symbols x bars) ** exponent for every component and compare with the bounds
+
+    :param results: DataFrame; the result of memory_scaling()
+
+    :param max_exponent: float; largest growth exponent accepted, 1 is linear
+
+    :param max_bytes_per_bar: float; largest total bytes per symbol x bar accepted at the largest run, None for no bound
+
+    :param min_bytes: int; components holding less at the largest run are too small to fit and are not checked
+
+    :return: (DataFrame, list); exponent of every component and the failed bounds (empty if all hold)
+    """
+    size = np.log(results['symbols'] * results['bars'])
+    rows, failures = [], []
+    for component in [c for c in COMPONENTS + ['other', 'total'] if c in results.columns]:
+        held = results[component].clip(lower=1)
+        exponent = np.polyfit(size, np.log(held), 1)[0] if size.nunique() > 1 else np.nan
+        rows.append((component, exponent, int(results[component].iloc[-1])))
+        if component != 'other' and results[component].iloc[-1] >= min_bytes and exponent > max_exponent:
+            failures.append("%s grows with exponent %.2f > %.2f" % (component, exponent, max_exponent))
+    if max_bytes_per_bar is not None:
+        largest = results.iloc[-1]
+        per_bar = largest['total'] / float(largest['symbols'] * largest['bars'])
+        if per_bar > max_bytes_per_bar:
+            failures.append("%.0f bytes per symbol x bar > %.0f" % (per_bar, max_bytes_per_bar))
+    return pd.DataFrame(rows, columns=['component', 'exponent', 'bytes']).set_index('component'), failures
+
+
+def main(argv=None):
+    import contextlib
+
+    from run import load_component
+
+    parser = argparse.ArgumentParser(description="Check how the memory of a backtest grows with symbols x bars.")
+    parser.add_argument('csv_dir', help="directory of the bar csv files")
+    parser.add_argument('strategy', help="strategy as module.Class or file.py:Class")
+    parser.add_argument('--symbol-list', default=None, help="comma separated symbols, default: every csv file")
+    parser.add_argument('--symbols', default='1,2,4', help="comma separated numbers of symbols")
+    parser.add_argument('--bars', default='250,500,1000', help="comma separated numbers of bars")
+    parser.add_argument('--max-exponent', type=float, default=1.0, help="largest growth exponent accepted")
+    parser.add_argument('--max-bytes-per-bar', type=float, default=None, help="largest bytes per symbol x bar")
+    args = parser.parse_args(argv)
+
+    if args.symbol_list:
+        symbol_list = args.symbol_list.split(',')
+    else:
+        symbol_list = sorted(os.path.splitext(f)[0] for f in os.listdir(args.csv_dir) if f.endswith('.csv'))
+    strategy = load_component(args.strategy)
+    symbol_counts = [min(int(n), len(symbol_list)) for n in args.symbols.split(',')]
+    bar_counts = [int(n) for n in args.bars.split(',')]
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results = memory_scaling(args.csv_dir, symbol_list, strategy, symbol_counts, bar_counts)
+    exponents, failures = check_scaling(results, args.max_exponent, args.max_bytes_per_bar)
+    print(results.to_string(index=False))
+    print(exponents)
+    for failure in failures:
+        print("FAIL: %s" % failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
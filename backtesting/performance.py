@@ -10,6 +10,23 @@ from __future__ import print_function
 import numpy as np
 import pandas as pd
 
+YEAR = 365.25 * 86400 * 10 ** 9
+
+
+def infer_periods(index):
+    """
+    number of bars per year of the data: the bars of a datetime index over the years it spans.
+    Daily stock bars give about 252, daily crypto bars about 365, so no trading calendar is assumed.
+
+    :param index: DatetimeIndex; datetime of each bar, repeated datetimes are counted once
+
+    :return: float; bars per year, NaN if the index spans no time
+    """
+    times = np.unique(pd.DatetimeIndex(index).asi8)
+    if len(times) < 2:
+        return np.nan
+    return (len(times) - 1) * YEAR / float(times[-1] - times[0])
+
 
 def create_sharpe_ratio(returns, periods=252):
     """
@@ -44,3 +61,159 @@ def create_drawdowns(pnl):
         drawdown[t] = (hwm[t] - pnl[t])
         duration[t] = (0 if drawdown[t] == 0 else duration[t - 1] + 1)
     return drawdown, drawdown.max(), duration.max()
+
+
+def _window_sum(values, window):
+    """
+    sum of values over every trailing window with one cumulative sum
+
+    :return: ndarray; nan for the first window - 1 bars
+    """
+    total = np.concatenate(([0.0], np.cumsum(values)))
+    out = np.full(len(values), np.nan)
+    out[window - 1:] = total[window:] - total[:-window]
+    return out
+
+
+def _rolling_moments(returns, window, min_periods=None):
+    """
+    count, mean and (population) variance of the non nan returns of every trailing window
+
+    :return: (ndarray, ndarray, ndarray); nan where the window has less than min_periods returns
+    """
+    r = np.asarray(returns, dtype=np.float64)
+    valid = ~np.isnan(r)
+    # center on the overall mean so the sum of squares does not cancel
+    center = r[valid].mean() if valid.any() else 0.0
+    x = np.where(valid, r - center, 0.0)
+    count = _window_sum(valid.astype(np.float64), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = _window_sum(x, window) / count
+        var = np.maximum(_window_sum(x * x, window) / count - mean * mean, 0.0)
+    short = ~(count >= (window if min_periods is None else min_periods))
+    mean[short] = np.nan
+    var[short] = np.nan
+    return count, mean + center, var
+
+
+def rolling_sharpe(returns, window, periods=None, min_periods=None):
+    """
+    Sharpe ratio of every trailing window, as create_sharpe_ratio, in O(n)
+
+    :param returns: Series; period percentage returns.
+    :param window: int; bars per window.
+    :param periods: float; bars per year, None to infer it from the index.
+    :param min_periods: int; least non nan returns of a window, None for window.
+    :return: Series; rolling Sharpe ratio
+    """
+    periods = infer_periods(returns.index) if periods is None else periods
+    count, mean, var = _rolling_moments(returns, window, min_periods)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.sqrt(periods) * mean / np.sqrt(var)
+    return pd.Series(sharpe, index=returns.index)
+
+
+def rolling_sortino(returns, window, periods=None, target=0.0, min_periods=None):
+    """
+    Sortino ratio of every trailing window, the mean excess return over the downside deviation, in O(n)
+
+    :param returns: Series; period percentage returns.
+    :param window: int; bars per window.
+    :param periods: float; bars per year, None to infer it from the index.
+    :param target: float; minimum acceptable return of a bar.
+    :param min_periods: int; least non nan returns of a window, None for window.
+    :return: Series; rolling Sortino ratio
+    """
+    periods = infer_periods(returns.index) if periods is None else periods
+    count, mean, var = _rolling_moments(returns, window, min_periods)
+    r = np.asarray(returns, dtype=np.float64)
+    downside = np.minimum(np.nan_to_num(r - target), 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        downside_dev = np.sqrt(_window_sum(downside * downside, window) / count)
+        sortino = np.sqrt(periods) * (mean - target) / downside_dev
+    return pd.Series(sortino, index=returns.index)
+
+
+def rolling_volatility(returns, window, periods=None, min_periods=None):
+    """
+    annualized (population) standard deviation of every trailing window, in O(n)
+
+    :param returns: Series; period percentage returns.
+    :param window: int; bars per window.
+    :param periods: float; bars per year, None to infer it from the index.
+    :param min_periods: int; least non nan returns of a window, None for window.
+    :return: Series; rolling volatility
+    """
+    periods = infer_periods(returns.index) if periods is None else periods
+    count, mean, var = _rolling_moments(returns, window, min_periods)
+    return pd.Series(np.sqrt(var * periods), index=returns.index)
+
+
+def rolling_beta(returns, benchmark, window, min_periods=None):
+    """
+    beta against a benchmark of every trailing window, cov(returns, benchmark) / var(benchmark), in O(n).
+    Only bars where both returns are known are used.
+
+    :param returns: Series; period percentage returns.
+    :param benchmark: Series; period percentage returns of the benchmark, aligned on the index of returns.
+    :param window: int; bars per window.
+    :param min_periods: int; least bars with both returns in a window, None for window.
+    :return: Series; rolling beta
+    """
+    x = np.asarray(returns, dtype=np.float64)
+    y = np.asarray(benchmark.reindex(returns.index), dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    if valid.any():
+        x = np.where(valid, x - x[valid].mean(), 0.0)
+        y = np.where(valid, y - y[valid].mean(), 0.0)
+    count = _window_sum(valid.astype(np.float64), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = _window_sum(x, window) / count
+        mean_y = _window_sum(y, window) / count
+        cov = _window_sum(x * y, window) / count - mean_x * mean_y
+        var = _window_sum(y * y, window) / count - mean_y * mean_y
+        beta = cov / var
+    beta[~(count >= (window if min_periods is None else min_periods))] = np.nan
+    return pd.Series(beta, index=returns.index)
+
+
+def rolling_max_drawdown(pnl, window):
+    """
+    largest peak-to-trough drawdown of the PnL curve inside every trailing window, as create_drawdowns, in O(n).
+    nan in pnl are filled with the last known value.
+
+    :param pnl: Series; equity curve.
+    :param window: int; bars per window.
+    :return: Series; rolling max drawdown, nan until a window of known values is complete
+    """
+    import kernels  # imported here so that importing performance does not import numba
+
+    values = pnl.ffill().values.astype(np.float64)
+    known = ~np.isnan(values)
+    out = np.full(len(values), np.nan)
+    if known.any():
+        first = int(np.argmax(known))
+        out[first:] = kernels.rolling_max_drawdown(np.ascontiguousarray(values[first:]), window)
+    return pd.Series(out, index=pnl.index)
+
+
+def create_rolling_stats(equity_curve, window, benchmark=None, periods=None):
+    """
+    rolling analytics of an equity curve of Portfolio
+
+    :param equity_curve: DataFrame; with returns and equity_curve columns.
+    :param window: int; bars per window.
+    :param benchmark: Series; period percentage returns of a benchmark, None to skip beta.
+    :param periods: float; bars per year, None to infer it from the index.
+    :return: DataFrame; sharpe, sortino, volatility, max_drawdown (and beta) of every trailing window
+    """
+    returns = equity_curve['returns']
+    periods = infer_periods(equity_curve.index) if periods is None else periods
+    stats = pd.DataFrame(index=equity_curve.index)
+    stats['sharpe'] = rolling_sharpe(returns, window, periods)
+    stats['sortino'] = rolling_sortino(returns, window, periods)
+    stats['volatility'] = rolling_volatility(returns, window, periods)
+    stats['max_drawdown'] = rolling_max_drawdown(equity_curve['equity_curve'], window)
+    if benchmark is not None:
+        stats['beta'] = rolling_beta(returns, benchmark, window)
+    return stats
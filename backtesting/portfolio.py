@@ -7,14 +7,22 @@ Created on Mon Apr 10 16:51:08 2017
 
 from __future__ import print_function
 
+import copy
+
 try:
     import Queue as queue
 except ImportError:
     import queue
+import numpy as np
 import pandas as pd
 
 from event import OrderEvent
-from performance import create_sharpe_ratio, create_drawdowns
+from journal import FillJournal
+from performance import create_sharpe_ratio, create_drawdowns, infer_periods
+from sizing import FixedQuantitySizer
+
+# OrderEvent.direction and FillEvent.direction as the sign of the position change
+DIRECTION_CODES = {'BUY': 1, 'SELL': -1}
 
 
 class Portfolio(object):
@@ -22,7 +30,8 @@ class Portfolio(object):
     Portfolio can handle the positions and market value of all instruments at a resolution of a Bar object.
     """
 
-    def __init__(self, bars, events, start_date, initial_capital=100000):
+    def __init__(self, bars, events, start_date, initial_capital=100000, output_path='equity.csv', sizer=None,
+                 journal=None):
         """
         :param bars: DataHandler; DataHandler object with current data.
 
@@ -32,12 +41,24 @@ class Portfolio(object):
 
         :param initial_capital: float; initial capital.
 
+        :param output_path: string; csv file the equity curve is written to, None to skip writing.
+
+        :param sizer: PositionSizer; turns signals into order quantities, 100 units per signal by default.
+            The portfolio works on its own copy, so one sizer can be passed to several backtests.
+
+        :param journal: string or FillJournal; every fill is recorded to this journal, None to skip recording.
+            A journal opened from a path is closed by close(), a FillJournal object is left open for the caller.
+
         :param symbol_list: list; a list of symbol strings
 
         :param all_positions: list of dict; historical list of a dict(k: datetime and symbol strings; v:datetime and positions of all symbols)
 
         :param current_position: dict; current position for last market bar updated.
 
+        :param symbol_index: dict; key: symbol; value: position of the symbol in symbol_list
+
+        :param positions: ndarray; current positions as a vector ordered as symbol_list
+
         :param all_holdings: dict; historical list of all symbol holdings.
 
         :param current_holdings: dict; the most up to date dict of all symbol holdings values.
@@ -50,8 +71,16 @@ class Portfolio(object):
         self.symbol_list = self.bars.symbol_list
         self.start_date = start_date
         self.initial_capital = initial_capital
+        self.output_path = output_path
+        self.sizer = copy.deepcopy(sizer) if sizer is not None else FixedQuantitySizer(100)
+        self._owns_journal = isinstance(journal, str)
+        if self._owns_journal:
+            journal = FillJournal(journal, self.symbol_list)
+        self.journal = journal
         self.all_positions = self.construct_all_positions()
         self.current_positions = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
+        self.symbol_index = dict((s, i) for i, s in enumerate(self.symbol_list))
+        self.positions = np.zeros(len(self.symbol_list), dtype=np.int64)
         self.all_holdings = self.construct_all_holdings()
         self.current_holdings = self.construct_current_holdings()
         self.equity_curve = None
@@ -103,24 +132,21 @@ class Portfolio(object):
         """
         latest_datetime = self.bars.get_latest_bar_datetime(self.symbol_list[0])
 
-        dp = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
+        dp = dict(zip(self.symbol_list, self.positions.tolist()))
         dp['datetime'] = latest_datetime
 
-        for s in self.symbol_list:
-            dp[s] = self.current_positions[s]
-
         self.all_positions.append(dp)
 
-        dh = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
+        # mark to market all symbols at once
+        prices = self.bars.get_latest_symbols_value('adj_close')
+        self.sizer.update(prices)
+        market_values = self.positions * prices
+
+        dh = dict(zip(self.symbol_list, market_values.tolist()))
         dh['datetime'] = latest_datetime
         dh['cash'] = self.current_holdings['cash']
         dh['commission'] = self.current_holdings['commission']
-        dh['total'] = self.current_holdings['total']
-
-        for s in self.symbol_list:
-            market_value = self.current_positions[s] * self.bars.get_latest_bar_value(s, 'adj_close')
-            dh[s] = market_value
-            dh['total'] += market_value
+        dh['total'] = self.current_holdings['total'] + np.dot(self.positions, prices)
 
         self.all_holdings.append(dh)
 
@@ -132,13 +158,9 @@ class Portfolio(object):
         :param fill: FillEvent; it can be used in backtest.
 
         """
-        fill_dir = 0
-        if fill.direction == 'BUY':
-            fill_dir = 1
-        if fill.direction == 'SELL':
-            fill_dir = -1
-
+        fill_dir = DIRECTION_CODES.get(fill.direction, 0)
         self.current_positions[fill.symbol] += fill_dir * fill.quantity
+        self.positions[self.symbol_index[fill.symbol]] = self.current_positions[fill.symbol]
 
     def update_holdings_from_fill(self, fill):
         """
@@ -147,17 +169,16 @@ class Portfolio(object):
         :param fill: FillEvent; it can be used in backtest.
 
         """
-        fill_dir = 0
-        if fill.direction == 'BUY':
-            fill_dir = 1
-        if fill.direction == 'SELL':
-            fill_dir = -1
+        fill_dir = DIRECTION_CODES.get(fill.direction, 0)
         fill_cost = self.bars.get_latest_bar_value(fill.symbol, "adj_close")
         cost = fill_dir * fill_cost * fill.quantity
         self.current_holdings[fill.symbol] += cost
         self.current_holdings['commission'] += fill.commission
         self.current_holdings['cash'] -= (cost + fill.commission)
         self.current_holdings['total'] -= (cost + fill.commission)
+        if self.journal is not None:
+            bar_time = self.bars.get_latest_bar_time(fill.symbol)
+            self.journal.record(bar_time, fill.symbol, fill_dir, fill.quantity, fill_cost, fill.commission)
 
     def update_fill(self, event):
         """
@@ -184,18 +205,21 @@ class Portfolio(object):
         direction = signal.signal_type
         strength = signal.strength
 
-        mkt_quantity = 100
+        mkt_quantity = self.sizer.order_quantity(self, symbol, strength)
         cur_quantity = self.current_positions[symbol]
         order_type = 'MKT'
 
+        order_dir, quantity = None, 0
         if direction == 'LONG' and cur_quantity == 0:
-            order = OrderEvent(symbol, order_type, mkt_quantity, 'BUY')
+            order_dir, quantity = 'BUY', mkt_quantity
         if direction == 'SHORT' and cur_quantity == 0:
-            order = OrderEvent(symbol, order_type, mkt_quantity, 'SELL')
+            order_dir, quantity = 'SELL', mkt_quantity
         if direction == 'EXIT' and cur_quantity > 0:
-            order = OrderEvent(symbol, order_type, abs(cur_quantity), 'SELL')
+            order_dir, quantity = 'SELL', abs(cur_quantity)
         if direction == 'EXIT' and cur_quantity < 0:
-            order = OrderEvent(symbol, order_type, abs(cur_quantity), 'BUY')
+            order_dir, quantity = 'BUY', abs(cur_quantity)
+        if order_dir is not None and quantity > 0:
+            order = OrderEvent(symbol, order_type, quantity, order_dir)
         return order
 
     # 根据SIFGNAL添加order到event queue
@@ -216,12 +240,26 @@ class Portfolio(object):
 
         """
 
+        if self.journal is not None:
+            self.journal.flush()
+
         curve = pd.DataFrame(self.all_holdings)
         curve.set_index('datetime', inplace=True)
         curve['returns'] = curve['total'].pct_change()
         curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
         self.equity_curve = curve
 
+    def close(self):
+        """
+        release the resources of the run, called by Backtest when the run ends.
+        The fill journal is closed if the portfolio opened it, else flushed.
+        """
+        if self.journal is not None:
+            if self._owns_journal:
+                self.journal.close()
+            else:
+                self.journal.flush()
+
     def output_summary_stats(self):
         """
         Calulate states(total_return, sharpe_ratio, max_drawdown, max_duration).
@@ -232,7 +270,7 @@ class Portfolio(object):
         returns = self.equity_curve['returns']
         pnl = self.equity_curve['equity_curve']
 
-        sharpe_ratio = create_sharpe_ratio(returns, periods=252 * 60 * 6.5)
+        sharpe_ratio = create_sharpe_ratio(returns, periods=infer_periods(self.equity_curve.index))
         drawdown, max_dd, max_duration = create_drawdowns(pnl)
         self.equity_curve['drawdown'] = drawdown
 
@@ -240,5 +278,6 @@ class Portfolio(object):
                  ("Sharpe Ratio", "%0.2f%%" % sharpe_ratio),
                  ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
                  ("Drawdown Duration", "%d" % max_duration)]
-        self.equity_curve.to_csv('equity.csv')
+        if self.output_path is not None:
+            self.equity_curve.to_csv(self.output_path)
         return stats
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Data quality checks and preprocessing of the csv bars, run as vectorized passes over
+(bars x symbols) arrays of all symbols at once.
+
+The checks are gap detection, OHLC consistency, non positive prices, return outliers and
+suspected splits. The adjustments are spike removal, split/dividend adjustment of adj_close
+and alignment of all symbols on one calendar. The cleaned arrays can be cached on disk so
+later backtests load the cleaned form directly.
+"""
+
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume', 'adj_close']
+PRICE_FIELDS = ['open', 'high', 'low', 'close', 'adj_close']
+SPLIT_RATIOS = np.array([1.0 / 4, 1.0 / 3, 1.0 / 2, 2.0, 3.0, 4.0])
+# bump when a change of the checks or adjustments alters the cleaned arrays, so that stale cache files are not reused
+PREPROCESS_VERSION = '2'
+
+
+def forward_fill(values):
+    """
+    fill nan with the last valid value along the bar axis
+
+    :param values: ndarray; bars x symbols
+
+    :return: ndarray; the filled copy, leading nan are kept
+    """
+    valid = ~np.isnan(values)
+    rows = np.where(valid, np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = values[rows, np.arange(values.shape[1])]
+    filled[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    return filled
+
+
+class Preprocessor(object):
+    """
+    Preprocessor loads the csv files of a symbol list, checks and cleans them and
+    returns aligned column arrays together with a report of the issues found.
+    """
+
+    def __init__(self, calendar=None, outlier_threshold=10.0, remove_spikes=True, gap_factor=3.0, actions=None,
+                 cache_dir=None):
+        """
+        :param calendar: DatetimeIndex; bars are aligned on it, None to use the union of all symbol indexes
+
+        :param outlier_threshold: float; robust z-score (median/MAD) of a log return above which it is an outlier
+
+        :param remove_spikes: boolean; replace single bar spikes (an outlier reverted by the next bar) by the previous value
+
+        :param gap_factor: float; a calendar interval longer than gap_factor times the usual one is a gap
+
+        :param actions: DataFrame; corporate actions with columns symbol, datetime, split (new shares per share)
+            and dividend (cash per share), adj_close is rebuilt from close with them. None keeps adj_close
+
+        :param cache_dir: string; directory of the cleaned arrays, None for no caching
+        """
+        self.calendar = calendar
+        self.outlier_threshold = outlier_threshold
+        self.remove_spikes = remove_spikes
+        self.gap_factor = gap_factor
+        self.actions = actions
+        self.cache_dir = cache_dir
+
+    def _cache_key(self, csv_dir, symbol_list):
+        h = hashlib.sha256()
+        for s in symbol_list:
+            h.update(s.encode('utf-8'))
+            with open(os.path.join(csv_dir, '%s.csv' % s), 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        config = {
+            'version': PREPROCESS_VERSION,
+            'calendar': None if self.calendar is None else [int(t) for t in pd.DatetimeIndex(self.calendar).asi8],
+            'outlier_threshold': self.outlier_threshold,
+            'remove_spikes': self.remove_spikes,
+            'gap_factor': self.gap_factor,
+            'actions': None if self.actions is None else self.actions.to_csv(index=False),
+        }
+        h.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def load(self, csv_dir, symbol_list):
+        """
+        return the cleaned bars, from the cache if they were cleaned before
+
+        :param csv_dir: string; the path of csv data
+
+        :param symbol_list: list; a list of symbol strings
+
+        :return: (DatetimeIndex, dict, DataFrame); the calendar, dict of (bars x symbols) column arrays and the report
+        """
+        if self.cache_dir is None:
+            return self.run(csv_dir, symbol_list)
+
+        key = self._cache_key(csv_dir, symbol_list)
+        path = os.path.join(self.cache_dir, '%s.npz' % key)
+        report_path = os.path.join(self.cache_dir, '%s.report.csv' % key)
+        if os.path.exists(path) and os.path.exists(report_path):
+            with np.load(path) as arrays:
+                bar_index = pd.DatetimeIndex(arrays['bar_index'])
+                bar_columns = dict((f, arrays[f]) for f in FIELDS)
+            report = pd.read_csv(report_path, parse_dates=['datetime'])
+            return bar_index, bar_columns, report
+
+        bar_index, bar_columns, report = self.run(csv_dir, symbol_list)
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        np.savez(path, bar_index=bar_index.asi8, **bar_columns)
+        report.to_csv(report_path, index=False)
+        return bar_index, bar_columns, report
+
+    def run(self, csv_dir, symbol_list):
+        """
+        read, check and clean the csv files
+
+        :param csv_dir: string; the path of csv data
+
+        :param symbol_list: list; a list of symbol strings
+
+        :return: (DatetimeIndex, dict, DataFrame); the calendar, dict of (bars x symbols) column arrays and the report
+        """
+        frames = [pd.io.parsers.read_csv(os.path.join(csv_dir, '%s.csv' % s), header=0, index_col=0, parse_dates=True,
+                                         names=['datetime'] + FIELDS) for s in symbol_list]
+        if self.calendar is not None:
+            bar_index = pd.DatetimeIndex(self.calendar)
+        else:
+            bar_index = frames[0].index
+            for frame in frames[1:]:
+                bar_index = bar_index.union(frame.index)
+        bar_index = bar_index.sort_values()
+
+        columns = {}
+        for f in FIELDS:
+            columns[f] = np.column_stack([frame[~frame.index.duplicated()][f].reindex(bar_index).values
+                                          for frame in frames]).astype(np.float64)
+
+        self._issues = []
+        self._symbols = np.asarray(symbol_list)
+        self._bar_index = bar_index
+
+        self._check_gaps(bar_index)
+        self._check_prices(columns)
+        if self.actions is not None:
+            self._adjust(columns, symbol_list)
+        self._check_returns(columns)
+        self._align(columns)
+
+        report = pd.DataFrame(self._issues, columns=['symbol', 'datetime', 'check', 'value'])
+        report = report.sort_values(['datetime', 'symbol']).reset_index(drop=True)
+        print("preprocess: %d bars, %d symbols, %d issues" % (len(bar_index), len(symbol_list), len(report)))
+        return bar_index, columns, report
+
+    def _flag(self, check, mask, values=None):
+        """
+        add an issue for every True of a (bars x symbols) mask
+        """
+        rows, cols = np.nonzero(mask)
+        values = np.full(len(rows), np.nan) if values is None else values[rows, cols]
+        self._issues.extend(zip(self._symbols[cols], self._bar_index[rows], [check] * len(rows), values))
+
+    def _check_gaps(self, bar_index):
+        """
+        calendar intervals much longer than the usual (median) interval
+        """
+        if len(bar_index) < 3:
+            return
+        deltas = np.diff(bar_index.asi8)
+        usual = np.median(deltas)
+        for i in np.nonzero(deltas > self.gap_factor * usual)[0]:
+            self._issues.append(('*', bar_index[i + 1], 'time_gap', deltas[i] / usual))
+
+    def _check_prices(self, columns):
+        """
+        missing bars inside the life of a symbol, non positive prices and inconsistent OHLC.
+        Non positive prices are dropped, high/low are widened to cover open and close.
+        """
+        close = columns['close']
+        present = ~np.isnan(close)
+        alive = np.maximum.accumulate(present, axis=0) & np.maximum.accumulate(present[::-1], axis=0)[::-1]
+        self._flag('missing_bar', alive & ~present)
+
+        for f in PRICE_FIELDS:
+            bad = columns[f] <= 0
+            self._flag('non_positive_%s' % f, bad, columns[f])
+            columns[f][bad] = np.nan
+
+        body_high = np.fmax(columns['open'], columns['close'])
+        body_low = np.fmin(columns['open'], columns['close'])
+        with np.errstate(invalid='ignore'):
+            bad = (columns['high'] < body_high) | (columns['low'] > body_low) | (columns['high'] < columns['low'])
+        self._flag('ohlc_inconsistent', bad, columns['high'] - columns['low'])
+        columns['high'] = np.fmax(columns['high'], body_high)
+        columns['low'] = np.fmin(columns['low'], body_low)
+
+    def _adjust(self, columns, symbol_list):
+        """
+        rebuild adj_close from close with the split and dividend factors of the actions,
+        the factors of an action apply to all bars before its datetime. Every applied action is
+        reported once, at its bar, with its factor.
+        """
+        close = forward_fill(columns['close'])
+        factor = np.ones_like(close)
+        symbol_index = dict((s, i) for i, s in enumerate(symbol_list))
+        for action in self.actions.itertuples(index=False):
+            j = symbol_index.get(action.symbol)
+            if j is None:
+                continue
+            t = self._bar_index.searchsorted(pd.Timestamp(action.datetime))
+            if t == 0 or t >= len(self._bar_index):
+                continue
+            split = getattr(action, 'split', 1.0)
+            dividend = getattr(action, 'dividend', 0.0)
+            f = 1.0
+            if split == split and split > 0:
+                f /= split
+            if dividend == dividend and dividend > 0 and close[t - 1, j] > 0:
+                f *= 1.0 - dividend / close[t - 1, j]
+            if f != 1.0:
+                factor[t - 1, j] *= f
+                self._issues.append((action.symbol, self._bar_index[t], 'adjusted', f))
+        # cumulative product from the latest bar backwards
+        factor = np.cumprod(factor[::-1], axis=0)[::-1]
+        columns['adj_close'] = columns['close'] * factor
+
+    def _check_returns(self, columns):
+        """
+        return outliers by robust z-score, single bar spikes and splits missing from adj_close
+        """
+        if len(self._bar_index) < 2:
+            return
+        with np.errstate(divide='ignore', invalid='ignore'):
+            prices = forward_fill(columns['adj_close'])
+            returns = np.full_like(prices, np.nan)
+            returns[1:] = np.log(prices[1:] / prices[:-1])
+            median = np.nanmedian(returns, axis=0)
+            mad = 1.4826 * np.nanmedian(np.abs(returns - median), axis=0)
+            mad[mad == 0] = np.nan
+            z = (returns - median) / mad
+            outlier = np.abs(z) > self.outlier_threshold
+        self._flag('outlier_return', outlier, returns)
+
+        if self.remove_spikes:
+            spike = np.zeros_like(outlier)
+            spike[:-1] = outlier[:-1] & outlier[1:] & (np.sign(returns[:-1]) == -np.sign(returns[1:]))
+            self._flag('spike_removed', spike, columns['adj_close'])
+            for f in PRICE_FIELDS:
+                columns[f][spike] = np.nan
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            close = forward_fill(columns['close'])
+            ratio = np.full_like(close, np.nan)
+            ratio[1:] = close[:-1] / close[1:]
+            adj_ratio = np.full_like(close, np.nan)
+            adj_ratio[1:] = prices[:-1] / prices[1:]
+            # close and adj_close jump by the same split ratio: the split is not in adj_close
+            split = np.zeros(close.shape, dtype=bool)
+            for r in SPLIT_RATIOS:
+                split |= (np.abs(ratio / r - 1.0) < 0.02) & (np.abs(adj_ratio / r - 1.0) < 0.02)
+        self._flag('suspected_split', split, ratio)
+
+    def _align(self, columns):
+        """
+        fill the bars a symbol misses on the calendar with its last valid bar
+        """
+        missing = np.isnan(columns['close'])
+        for f in FIELDS:
+            columns[f] = forward_fill(columns[f])
+        self._flag('filled', missing & ~np.isnan(columns['close']))
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Command-line runner: builds a Backtest from a json config file and simulates it.
+
+Only the standard library is imported at start-up. The data handler, strategy, portfolio
+and execution modules (and so numpy/pandas) are imported when the config names them.
+
+usage: python run.py config.json [--dry-run]
+"""
+
+from __future__ import print_function
+
+import time
+
+_START = time.time()
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import sys
+
+DEFAULT_DATA_HANDLER = 'data.HistoricCSVDataHandler'
+DEFAULT_PORTFOLIO = 'portfolio.Portfolio'
+DEFAULT_EXECUTION_HANDLER = 'excaution.SimulatedExecutionHandler'
+
+
+def parse_date(value):
+    """
+    parse a date string of the config
+
+    :param value: string; 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS', None is passed through
+
+    :return: datetime; the parsed datetime
+    """
+    if value is None:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError("unknown date format: %s" % value)
+
+
+def load_config(path):
+    """
+    read the json config, relative paths in it are resolved against the config directory
+
+    :param path: string; path of the config file
+
+    :return: dict; the config
+    """
+    with open(path) as f:
+        config = json.load(f)
+    config['base_dir'] = os.path.dirname(os.path.abspath(path))
+    return config
+
+
+def _resolve_path(config, path):
+    return os.path.normpath(os.path.join(config['base_dir'], path))
+
+
+def load_component(spec, base_dir='.'):
+    """
+    import the class named by spec
+
+    :param spec: string; 'module.Class' for modules on sys.path,
+        or 'path/to/file.py:Class' for a file relative to base_dir
+
+    :param base_dir: string; directory relative file paths are resolved against
+
+    :return: class; the named class
+    """
+    if ':' in spec:
+        path, name = spec.rsplit(':', 1)
+        path = os.path.normpath(os.path.join(base_dir, path))
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            from importlib import util
+            module_spec = util.spec_from_file_location(module_name, path)
+            module = util.module_from_spec(module_spec)
+            sys.modules[module_name] = module
+            module_spec.loader.exec_module(module)
+        except ImportError:
+            import imp
+            module = imp.load_source(module_name, path)
+    else:
+        module_name, name = spec.rsplit('.', 1)
+        module = importlib.import_module(module_name)
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        print("%s is not defined in %s" % (name, module_name))
+        raise
+
+
+def backtest_arguments(config):
+    """
+    the keyword arguments of the Backtest described by config, the named components are imported here
+
+    :param config: dict; the config, see load_config()
+
+    :return: dict; keyword arguments of Backtest
+    """
+    base_dir = config.get('base_dir', '.')
+    data = config.get('data', {})
+    strategy = config['strategy']
+    portfolio = config.get('portfolio', {})
+    execution = config.get('execution', {})
+    output = config.get('output', {})
+
+    start_date = parse_date(config.get('start_date'))
+    end_date = parse_date(config.get('end_date'))
+
+    data_handler_params = dict(data.get('params', {}))
+    if start_date is not None:
+        data_handler_params['start_date'] = start_date
+    if end_date is not None:
+        data_handler_params['end_date'] = end_date
+    if 'preprocess' in data:
+        from preprocess import Preprocessor
+        preprocess_params = dict(data['preprocess'])
+        if preprocess_params.get('cache_dir') is not None:
+            preprocess_params['cache_dir'] = _resolve_path(config, preprocess_params['cache_dir'])
+        data_handler_params['preprocessor'] = Preprocessor(**preprocess_params)
+
+    portfolio_params = dict(portfolio.get('params', {}))
+    if 'sizer' in portfolio:
+        sizer = portfolio['sizer']
+        portfolio_params['sizer'] = load_component(sizer['class'], base_dir)(**sizer.get('params', {}))
+    if 'equity_csv' in output:
+        equity_csv = output['equity_csv']
+        portfolio_params['output_path'] = None if equity_csv is None else _resolve_path(config, equity_csv)
+    if output.get('fill_journal') is not None:
+        portfolio_params['journal'] = _resolve_path(config, output['fill_journal'])
+
+    return dict(
+        csv_dir=_resolve_path(config, data.get('csv_dir', '.')),
+        symbol_list=data['symbols'],
+        initial_capital=float(config.get('initial_capital', 100000.0)),
+        heartbeat=float(config.get('heartbeat', 0.0)),
+        start_date=start_date,
+        data_handler=load_component(data.get('handler', DEFAULT_DATA_HANDLER), base_dir),
+        execution_handler=load_component(execution.get('class', DEFAULT_EXECUTION_HANDLER), base_dir),
+        portfolio=load_component(portfolio.get('class', DEFAULT_PORTFOLIO), base_dir),
+        strategy=load_component(strategy['path'], base_dir),
+        strategy_params=strategy.get('params'),
+        portfolio_params=portfolio_params,
+        data_handler_params=data_handler_params,
+    )
+
+
+def build_backtest(config):
+    """
+    create the Backtest described by config, a ShardedBacktest if the config has a shard section
+
+    :param config: dict; the config, see load_config()
+
+    :return: Backtest; the backtest, ready for simulate_trading()
+    """
+    kwargs = backtest_arguments(config)
+    if 'shard' in config:
+        from shard import ShardedBacktest
+
+        kwargs['output_path'] = kwargs['portfolio_params'].pop('output_path', 'equity.csv')
+        kwargs.update(config['shard'])
+        return ShardedBacktest(**kwargs)
+
+    from backtest import Backtest
+
+    return Backtest(**kwargs)
+
+
+def run_cached(config, kwargs):
+    """
+    simulate the backtest through the result cache named in config['cache']
+
+    :param config: dict; the config, see load_config()
+
+    :param kwargs: dict; keyword arguments of Backtest
+
+    :return: list; summary stats
+    """
+    from cache import ResultCache, cached_backtest
+
+    cache_config = config['cache']
+    cache = ResultCache(_resolve_path(config, cache_config.get('dir', '.backtest_cache')),
+                        int(cache_config.get('max_bytes', 512 * 1024 * 1024)))
+    equity_curve, stats, hit = cached_backtest(cache, **kwargs)
+    if hit:
+        print("cache hit")
+        output_path = kwargs['portfolio_params'].get('output_path', 'equity.csv')
+        if output_path is not None:
+            equity_curve.to_csv(output_path)
+    return stats
+
+
+def write_stats(path, stats):
+    """
+    dump the summary stats as json
+
+    :param path: string; output file
+
+    :param stats: list; (name, value) pairs of output_summary_stats()
+    """
+    with open(path, 'w') as f:
+        json.dump(dict(stats), f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a backtest described by a json config file.")
+    parser.add_argument('config', help="path of the json config")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="build the components, report the startup time and exit")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if 'cache' in config and 'shard' in config:
+        raise ValueError("a config can have a cache or a shard section, not both")
+    if 'cache' in config:
+        kwargs = backtest_arguments(config)
+        print("startup: %.3fs" % (time.time() - _START))
+        if args.dry_run:
+            return 0
+        stats = run_cached(config, kwargs)
+    else:
+        backtest = build_backtest(config)
+        print("startup: %.3fs" % (time.time() - _START))
+        if args.dry_run:
+            return 0
+        stats = backtest.simulate_trading()
+
+    stats_json = config.get('output', {}).get('stats_json')
+    if stats_json is not None:
+        write_stats(_resolve_path(config, stats_json), stats)
+    print("total: %.3fs" % (time.time() - _START))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
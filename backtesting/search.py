@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter search with early stopping by successive halving.
+
+All candidates are first run on a short head of the timeline. Candidates whose interim
+Sharpe ratio or drawdown breaks the thresholds are dropped, and only the best 1/eta by
+Sharpe ratio go on to a timeline eta times longer, until the survivors run on the whole
+history. The bars simulated are compared with an exhaustive grid over the whole history.
+"""
+
+from __future__ import print_function
+
+import math
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+
+from cache import cached_backtest, parameter_grid
+from performance import create_drawdowns, create_sharpe_ratio, infer_periods
+
+
+def evaluate(equity_curve, periods=None):
+    """
+    numeric summary of an equity curve
+
+    :param equity_curve: DataFrame; Portfolio.equity_curve
+
+    :param periods: int; bars per year for the Sharpe ratio, None to infer it from the bars per year of the data
+
+    :return: dict; total_return, sharpe_ratio, max_drawdown and bars
+    """
+    if periods is None:
+        periods = infer_periods(equity_curve.index)
+    returns = equity_curve['returns']
+    pnl = equity_curve['equity_curve']
+    if returns.count() > 1 and returns.std() > 0:
+        sharpe = float(create_sharpe_ratio(returns, periods=periods))
+    else:
+        sharpe = 0.0
+    drawdown, max_dd, max_duration = create_drawdowns(pnl)
+    return {
+        'total_return': float(pnl.iloc[-1] - 1.0),
+        'sharpe_ratio': sharpe if np.isfinite(sharpe) else 0.0,
+        'max_drawdown': float(max_dd) if np.isfinite(max_dd) else 0.0,
+        'bars': len(equity_curve),
+    }
+
+
+class SuccessiveHalvingSearch(object):
+    """
+    SuccessiveHalvingSearch runs a parameter grid of a strategy on growing slices of the timeline.
+    """
+
+    def __init__(self, param_grid, eta=3, min_fraction=None, min_sharpe=None, max_drawdown=None, periods=None,
+                 cache=None, **backtest_kwargs):
+        """
+        :param param_grid: dict or list; a dict of parameter lists, or a list of strategy_params dicts
+
+        :param eta: int; 1/eta of the candidates survive each rung, and the next rung is eta times longer
+
+        :param min_fraction: float; fraction of the timeline of the first rung, by default one rung per
+            halving down to a single survivor
+
+        :param min_sharpe: float; candidates with a lower interim Sharpe ratio are dropped, None for no threshold
+
+        :param max_drawdown: float; candidates with a larger interim drawdown are dropped, None for no threshold
+
+        :param periods: int; bars per year for the Sharpe ratio, None to infer it from the bars per year of the data
+
+        :param cache: ResultCache; interim and final runs are looked up and stored in it, None for no caching
+
+        :param backtest_kwargs: keyword arguments of Backtest except strategy_params and heartbeat
+        """
+        if isinstance(param_grid, dict):
+            param_grid = parameter_grid(param_grid)
+        self.candidates = list(param_grid)
+        self.eta = eta
+        if min_fraction is None:
+            rungs, n = 1, len(self.candidates)
+            while n > 1:
+                n = int(math.ceil(n / float(eta)))
+                rungs += 1
+            min_fraction = float(eta) ** -(rungs - 1)
+        self.min_fraction = min_fraction
+        self.min_sharpe = min_sharpe
+        self.max_drawdown = max_drawdown
+        self.periods = periods
+        self.cache = cache
+        self.backtest_kwargs = backtest_kwargs
+
+        self.history = []
+        self.bars_simulated = 0
+        self.bars_exhaustive = 0
+
+    def _timeline(self):
+        """
+        :return: DatetimeIndex; the bars of the whole backtest
+        """
+        kwargs = self.backtest_kwargs
+        handler = kwargs['data_handler'](queue.Queue(), kwargs['csv_dir'], kwargs['symbol_list'],
+                                         **(kwargs.get('data_handler_params') or {}))
+        return handler.bar_index
+
+    def _run(self, strategy_params, end_date):
+        """
+        :return: (equity_curve, simulated); simulated is False when the curve came from the cache
+        """
+        kwargs = dict(self.backtest_kwargs)
+        data_handler_params = dict(kwargs.pop('data_handler_params', None) or {})
+        data_handler_params['end_date'] = end_date
+        portfolio_params = dict(kwargs.pop('portfolio_params', None) or {})
+        portfolio_params['output_path'] = None
+
+        if self.cache is not None:
+            equity_curve, stats, hit = cached_backtest(self.cache, strategy_params=strategy_params,
+                                                       data_handler_params=data_handler_params,
+                                                       portfolio_params=portfolio_params, **kwargs)
+            return equity_curve, not hit
+
+        from backtest import Backtest
+        backtest = Backtest(heartbeat=0.0, strategy_params=strategy_params, portfolio_params=portfolio_params,
+                            data_handler_params=data_handler_params, **kwargs)
+        backtest.simulate_trading()
+        return backtest.portfolio.equity_curve, True
+
+    def _passes(self, metrics):
+        if self.min_sharpe is not None and metrics['sharpe_ratio'] < self.min_sharpe:
+            return False
+        if self.max_drawdown is not None and metrics['max_drawdown'] > self.max_drawdown:
+            return False
+        return True
+
+    def run(self):
+        """
+        run the search
+
+        :return: list; (strategy_params, metrics) of the survivors of the last rung, best Sharpe ratio first
+        """
+        timeline = self._timeline()
+        n_bars = len(timeline)
+        self.bars_exhaustive = n_bars * len(self.candidates)
+        self.bars_simulated = 0
+        self.history = []
+
+        survivors = list(self.candidates)
+        fraction = self.min_fraction
+        ranked = []
+        while survivors:
+            last = fraction >= 1.0 - 1e-9
+            bars = n_bars if last else max(1, int(math.ceil(fraction * n_bars)))
+            end_date = timeline[bars - 1]
+
+            results = []
+            for params in survivors:
+                equity_curve, simulated = self._run(params, end_date)
+                metrics = evaluate(equity_curve, self.periods)
+                if simulated:
+                    self.bars_simulated += bars
+                results.append((params, metrics))
+            ranked = sorted(results, key=lambda r: r[1]['sharpe_ratio'], reverse=True)
+            self.history.append({'bars': bars, 'candidates': len(survivors), 'results': ranked})
+            print("rung %d: %d candidates on %d bars" % (len(self.history), len(survivors), bars))
+
+            if last:
+                break
+            passed = [r for r in ranked if self._passes(r[1])]
+            keep = max(1, int(math.ceil(len(ranked) / float(self.eta))))
+            survivors = [params for params, metrics in passed[:keep]]
+            fraction = min(1.0, fraction * self.eta)
+
+        print("search: %d bars simulated, %d for the exhaustive grid, %.1f%% saved" %
+              (self.bars_simulated, self.bars_exhaustive, 100.0 * self.saved()))
+        return ranked if survivors else []
+
+    def saved(self):
+        """
+        :return: float; fraction of the bars of the exhaustive grid that the search did not simulate
+        """
+        if self.bars_exhaustive == 0:
+            return 0.0
+        return 1.0 - float(self.bars_simulated) / self.bars_exhaustive
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded backtests: the symbol list is partitioned into groups, every group runs as an
+independent sub-backtest in a worker process with its share of the capital, and the
+holdings of all groups are merged into one equity curve and summary.
+
+Every group is run on the calendar of the whole universe, as the unsharded backtest is.
+This is exact for strategies and portfolios whose symbols do not interact, e.g. the
+moving average cross with a fixed quantity sizer. Sizers that look at the total equity
+of the portfolio see only the equity of their own group.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import multiprocessing
+import os
+import pprint
+import sys
+
+import pandas as pd
+
+from performance import create_drawdowns, create_sharpe_ratio, infer_periods
+
+
+def partition(symbol_list, shards=None, group_size=1):
+    """
+    split a symbol list into groups, keeping the order of the symbols
+
+    :param symbol_list: list; a list of symbol strings
+
+    :param shards: int; number of groups of about equal size, None to use group_size
+
+    :param group_size: int; symbols per group when shards is None
+
+    :return: list of list; the groups
+    """
+    symbol_list = list(symbol_list)
+    if shards is not None:
+        shards = max(1, min(shards, len(symbol_list)))
+        size, extra = divmod(len(symbol_list), shards)
+        groups, start = [], 0
+        for i in range(shards):
+            stop = start + size + (1 if i < extra else 0)
+            groups.append(symbol_list[start:stop])
+            start = stop
+        return groups
+    return [symbol_list[i:i + group_size] for i in range(0, len(symbol_list), group_size)]
+
+
+def universe_calendar(csv_dir, symbol_list, preprocessor=None):
+    """
+    the union of the datetime indexes of all symbols, read without the bars
+
+    :param csv_dir: string; the path of csv data
+
+    :param symbol_list: list; a list of symbol strings
+
+    :param preprocessor: Preprocessor; its calendar is used when it has one
+
+    :return: DatetimeIndex; the calendar of the whole universe
+    """
+    if preprocessor is not None and preprocessor.calendar is not None:
+        return pd.DatetimeIndex(preprocessor.calendar)
+    calendar = None
+    for s in symbol_list:
+        index = pd.io.parsers.read_csv(os.path.join(csv_dir, '%s.csv' % s), header=0, index_col=0,
+                                       usecols=[0], parse_dates=True).index
+        calendar = index if calendar is None else calendar.union(index)
+    return calendar
+
+
+def _run_shard(task):
+    """
+    simulate the sub-backtest of one group, the target of the worker processes
+
+    :param task: dict; keyword arguments of Backtest and 'quiet'
+
+    :return: dict; equity curve (holdings columns) and the event counts
+    """
+    from backtest import Backtest
+
+    kwargs = dict(task)
+    quiet = kwargs.pop('quiet')
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+            backtest = Backtest(**kwargs)
+            try:
+                backtest._run_backtest()
+            finally:
+                backtest.close()
+        backtest.portfolio.create_equity_curve_dataframe()
+    curve = backtest.portfolio.equity_curve
+    return {
+        'equity_curve': curve.drop(['returns', 'equity_curve'], axis=1),
+        'signals': backtest.signals,
+        'orders': backtest.orders,
+        'fills': backtest.fills,
+    }
+
+
+def merge_holdings(curves, groups, capitals):
+    """
+    merge the holdings of independent sub-portfolios into one curve. Every curve is carried forward
+    over the bars of the other groups, and holds its initial capital in cash before its first bar.
+
+    :param curves: list of DataFrame; holdings of each group (index: datetime, columns: symbols, cash, commission, total)
+
+    :param groups: list of list; symbols of each group
+
+    :param capitals: list of float; initial capital of each group
+
+    :return: DataFrame; the combined curve with returns and equity_curve columns
+    """
+    # the first row holds the initial capital at start_date, which may be the datetime of the first bar,
+    # and the portfolio marks its last bar twice: merge the bar rows, then put both back
+    marked_twice = all(len(c) > 2 and c.index[-1] == c.index[-2] for c in curves)
+    bars = [c.iloc[1:-1] if marked_twice else c.iloc[1:] for c in curves]
+    index = bars[0].index
+    for b in bars[1:]:
+        index = index.union(b.index)
+
+    cash = pd.Series(0.0, index=index)
+    commission = pd.Series(0.0, index=index)
+    total = pd.Series(0.0, index=index)
+    market_values = []
+    for b, group, capital in zip(bars, groups, capitals):
+        b = b.reindex(index).ffill()
+        market_values.append(b[group].fillna(0.0))
+        cash += b['cash'].fillna(capital)
+        commission += b['commission'].fillna(0.0)
+        total += b['total'].fillna(capital)
+
+    curve = pd.concat(market_values, axis=1)
+    curve['cash'] = cash
+    curve['commission'] = commission
+    curve['total'] = total
+
+    first = dict([(s, 0.0) for g in groups for s in g] +
+                 [('cash', sum(capitals)), ('commission', 0.0), ('total', sum(capitals))])
+    first = pd.DataFrame([first], index=curves[0].index[:1])[list(curve.columns)]
+    parts = [first, curve, curve.iloc[-1:]] if marked_twice else [first, curve]
+    curve = pd.concat(parts)
+    curve.index.name = 'datetime'
+    curve['returns'] = curve['total'].pct_change()
+    curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
+    return curve
+
+
+class ShardedBacktest(object):
+    """
+    ShardedBacktest runs the symbols of a Backtest as independent groups in a process pool.
+    """
+
+    def __init__(self, csv_dir, symbol_list, initial_capital, heartbeat, start_date, data_handler, execution_handler,
+                 portfolio, strategy, strategy_params=None, portfolio_params=None, data_handler_params=None,
+                 shards=None, group_size=1, processes=None, shared_memory=False, output_path='equity.csv',
+                 quiet=True):
+        """
+        :param csv_dir ... data_handler_params: as Backtest, heartbeat is ignored
+
+        :param shards: int; number of groups, None for groups of group_size symbols
+
+        :param group_size: int; symbols per group when shards is None, 1 for per-symbol runs
+
+        :param processes: int; worker processes, None for one per core, 1 to run the groups in this process
+
+        :param shared_memory: boolean; load the bars once into a SharedBarStore that all workers read
+
+        :param output_path: string; csv file the combined equity curve is written to, None to skip writing
+
+        :param quiet: boolean; silence the output of the sub-backtests
+        """
+        self.csv_dir = csv_dir
+        self.symbol_list = list(symbol_list)
+        self.initial_capital = initial_capital
+        self.start_date = start_date
+        self.data_handler_cls = data_handler
+        self.execution_handler_cls = execution_handler
+        self.portfolio_cls = portfolio
+        self.strategy_cls = strategy
+        self.strategy_params = strategy_params or {}
+        self.portfolio_params = dict(portfolio_params or {})
+        if self.portfolio_params.get('journal') is not None:
+            raise ValueError("the groups of a sharded backtest cannot share a fill journal, "
+                             "run it unsharded to record fills")
+        self.data_handler_params = dict(data_handler_params or {})
+        self.groups = partition(self.symbol_list, shards, group_size)
+        self.capitals = [initial_capital * len(g) / float(len(self.symbol_list)) for g in self.groups]
+        self.processes = processes
+        self.shared_memory = shared_memory
+        self.output_path = output_path
+        self.quiet = quiet
+
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+        self.shard_curves = []
+        self.equity_curve = None
+
+    def _tasks(self, data_handler, data_handler_params):
+        portfolio_params = dict(self.portfolio_params)
+        portfolio_params['output_path'] = None
+        tasks = []
+        for group, capital in zip(self.groups, self.capitals):
+            tasks.append(dict(
+                csv_dir=self.csv_dir, symbol_list=group, initial_capital=capital,
+                heartbeat=0.0, start_date=self.start_date, data_handler=data_handler,
+                execution_handler=self.execution_handler_cls, portfolio=self.portfolio_cls,
+                strategy=self.strategy_cls, strategy_params=self.strategy_params,
+                portfolio_params=portfolio_params, data_handler_params=data_handler_params, quiet=self.quiet))
+        return tasks
+
+    def _run_shards(self):
+        """
+        simulate all groups, in the pool unless processes is 1
+
+        :return: list of dict; results of _run_shard() in the order of the groups
+        """
+        if not self.shared_memory:
+            params = dict(self.data_handler_params)
+            if params.get('calendar') is None:
+                params['calendar'] = universe_calendar(self.csv_dir, self.symbol_list, params.get('preprocessor'))
+            return self._map(self._tasks(self.data_handler_cls, params))
+
+        from sharedmem import SharedMemoryDataHandler, shared_bar_store
+
+        params = dict(self.data_handler_params)
+        # the store holds the bars of the whole universe, so every group is on its calendar
+        dates = dict((k, params.pop(k)) for k in ('start_date', 'end_date') if k in params)
+        with shared_bar_store(self.csv_dir, self.symbol_list, **params) as store:
+            dates['store'] = store.descriptor
+            return self._map(self._tasks(SharedMemoryDataHandler, dates))
+
+    def _map(self, tasks):
+        if self.processes == 1 or len(tasks) == 1:
+            return [_run_shard(task) for task in tasks]
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            return pool.map(_run_shard, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def simulate_trading(self):
+        """
+        simulate every group and merge them into one portfolio
+
+        :return: list; summary stats of the combined portfolio
+        """
+        print("running %d symbols in %d groups" % (len(self.symbol_list), len(self.groups)))
+        results = self._run_shards()
+        self.shard_curves = [r['equity_curve'] for r in results]
+        self.signals = sum(r['signals'] for r in results)
+        self.orders = sum(r['orders'] for r in results)
+        self.fills = sum(r['fills'] for r in results)
+
+        self.equity_curve = merge_holdings(self.shard_curves, self.groups, self.capitals)
+        stats = self.output_summary_stats()
+
+        print(self.equity_curve.tail(10))
+        pprint.pprint(stats)
+        print("Signal: %s" % self.signals)
+        print("Orders: %s" % self.orders)
+        print("Fills: %s" % self.fills)
+        return stats
+
+    def output_summary_stats(self):
+        """
+        Calulate states(total_return, sharpe_ratio, max_drawdown, max_duration) of the combined portfolio.
+
+        :return: list; summary data.
+        """
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
+        returns = self.equity_curve['returns']
+        pnl = self.equity_curve['equity_curve']
+
+        sharpe_ratio = create_sharpe_ratio(returns, periods=infer_periods(self.equity_curve.index))
+        drawdown, max_dd, max_duration = create_drawdowns(pnl)
+        self.equity_curve['drawdown'] = drawdown
+
+        stats = [("Total Return", "%0.2f%%" % ((total_return - 1.0) * 100.0)),
+                 ("Sharpe Ratio", "%0.2f%%" % sharpe_ratio),
+                 ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
+                 ("Drawdown Duration", "%d" % max_duration)]
+        if self.output_path is not None:
+            self.equity_curve.to_csv(self.output_path)
+        return stats
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Market data in OS shared memory for multi-process backtests.
+
+The parent loads the bars once and copies the (bars x symbols) column arrays into named
+shared memory segments. Worker processes attach read-only numpy views by name through a
+small picklable descriptor, so every worker reads the same physical pages.
+
+The parent owns the segments: they are unlinked when the store is closed, when the parent
+exits, and by the multiprocessing resource tracker if the parent crashes. Requires python 3.8+.
+"""
+
+from __future__ import print_function
+
+import atexit
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from data import HistoricCSVDataHandler
+
+# whether the resource tracker of this process was started by this process, decided on the first attach
+_own_tracker = None
+
+
+def _attach_segment(name):
+    """
+    attach an existing segment without letting a resource tracker of this process own it,
+    otherwise the segment would be unlinked when the worker exits.
+    Workers started by multiprocessing share the tracker of the parent, which must keep it.
+    """
+    global _own_tracker
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    if _own_tracker is None:
+        _own_tracker = getattr(resource_tracker._resource_tracker, '_fd', None) is None
+    segment = shared_memory.SharedMemory(name=name)
+    if _own_tracker:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+class SharedBarStore(object):
+    """
+    SharedBarStore holds bar_index and bar_columns of a data handler in shared memory.
+    """
+
+    def __init__(self, descriptor, segments, owner):
+        """
+        use SharedBarStore.create() or SharedBarStore.attach() instead
+
+        :param descriptor: dict; picklable description of the segments, pass it to the workers
+
+        :param segments: dict; key: 'bar_index' or column name; value: SharedMemory
+
+        :param owner: boolean; the owner unlinks the segments on close()
+        """
+        self.descriptor = descriptor
+        self.segments = segments
+        self.owner = owner
+        self.symbol_list = list(descriptor['symbols'])
+        self.fields = list(descriptor['fields'])
+        n_bars, n_symbols = descriptor['shape']
+
+        times = np.ndarray((n_bars,), dtype=np.int64, buffer=segments['bar_index'].buf)
+        times.flags.writeable = False
+        self.bar_times = times
+        self.bar_index = pd.DatetimeIndex(times.view('datetime64[ns]'))
+        self.bar_columns = {}
+        for f in self.fields:
+            column = np.ndarray((n_bars, n_symbols), dtype=descriptor['dtype'], buffer=segments[f].buf)
+            column.flags.writeable = False
+            self.bar_columns[f] = column
+        self._closed = False
+
+    @classmethod
+    def create(cls, bar_index, bar_columns, symbol_list, prefix='ibts'):
+        """
+        copy the bars into new shared memory segments
+
+        :param bar_index: DatetimeIndex; datetime of each bar
+
+        :param bar_columns: dict; key: column name; value: ndarray (bars x symbols)
+
+        :param symbol_list: list; a list of symbol strings, the column order of the arrays
+
+        :param prefix: string; prefix of the segment names
+
+        :return: SharedBarStore; the owning store
+        """
+        if shared_memory is None:
+            raise RuntimeError("shared memory market data requires python 3.8+")
+
+        fields = list(bar_columns)
+        n_bars, n_symbols = len(bar_index), len(symbol_list)
+        run_id = '%s_%d_%s' % (prefix, os.getpid(), uuid.uuid4().hex[:8])
+        segments = {}
+        try:
+            times = np.asarray(bar_index.asi8, dtype=np.int64)
+            segments['bar_index'] = shared_memory.SharedMemory(
+                name='%s_index' % run_id, create=True, size=max(times.nbytes, 1))
+            np.ndarray(times.shape, dtype=np.int64, buffer=segments['bar_index'].buf)[:] = times
+            for i, f in enumerate(fields):
+                column = np.asarray(bar_columns[f], dtype=np.float64)
+                segments[f] = shared_memory.SharedMemory(name='%s_%d' % (run_id, i), create=True,
+                                                         size=max(column.nbytes, 1))
+                np.ndarray(column.shape, dtype=np.float64, buffer=segments[f].buf)[:] = column
+        except Exception:
+            for segment in segments.values():
+                segment.close()
+                segment.unlink()
+            raise
+
+        descriptor = {
+            'symbols': list(symbol_list),
+            'fields': fields,
+            'shape': (n_bars, n_symbols),
+            'dtype': 'float64',
+            'segments': dict((k, v.name) for k, v in segments.items()),
+        }
+        store = cls(descriptor, segments, owner=True)
+        atexit.register(store.close)
+        return store
+
+    @classmethod
+    def from_handler(cls, handler, prefix='ibts'):
+        """
+        copy the bars of a data handler into shared memory
+
+        :param handler: HistoricCSVDataHandler; a loaded data handler
+
+        :return: SharedBarStore; the owning store
+        """
+        return cls.create(handler.bar_index, handler.bar_columns, handler.symbol_list, prefix)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """
+        attach read-only views to the segments of a store created in another process
+
+        :param descriptor: dict; SharedBarStore.descriptor of the owning store
+
+        :return: SharedBarStore; the attached store
+        """
+        if shared_memory is None:
+            raise RuntimeError("shared memory market data requires python 3.8+")
+        segments = dict((k, _attach_segment(name)) for k, name in descriptor['segments'].items())
+        return cls(descriptor, segments, owner=False)
+
+    def nbytes(self):
+        """
+        :return: int; bytes held in shared memory
+        """
+        return sum(segment.size for segment in self.segments.values())
+
+    def close(self):
+        """
+        release the segments of this process, the owner also unlinks them so the OS frees the memory
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.bar_columns = {}
+        self.bar_times = None
+        self.bar_index = None
+        for segment in self.segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                pass  # views are still referenced somewhere, the mapping goes away with them
+            if self.owner:
+                try:
+                    segment.unlink()
+                except (OSError, IOError):
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def shared_bar_store(csv_dir, symbol_list, prefix='ibts', **handler_params):
+    """
+    load the csv data once and put it into shared memory, use it as a context manager
+    so the segments are released when the run finishes or fails
+
+    :param csv_dir: string; the path of csv data
+
+    :param symbol_list: list; a list of symbol strings
+
+    :param handler_params: keyword arguments of HistoricCSVDataHandler, e.g. preprocessor
+
+    :return: SharedBarStore; the owning store
+    """
+    handler = HistoricCSVDataHandler(queue.Queue(), csv_dir, symbol_list, **handler_params)
+    return SharedBarStore.from_handler(handler, prefix)
+
+
+class SharedMemoryDataHandler(HistoricCSVDataHandler):
+    """
+    HistoricCSVDataHandler reading its bars from a SharedBarStore instead of csv files.
+    """
+
+    def __init__(self, events, csv_dir, symbol_list, store=None, start_date=None, end_date=None):
+        """
+        :param events: Queue; the Events Queue
+
+        :param csv_dir: string; not used, kept for the Backtest interface
+
+        :param symbol_list: list; symbols of the store to trade, a run of consecutive store symbols is not copied
+
+        :param store: SharedBarStore or dict; the store, or its descriptor to attach in this process
+
+        :param start_date: datetime; bars before it are dropped, None to keep all
+
+        :param end_date: datetime; bars after it are dropped, None to keep all
+        """
+        if store is None:
+            raise ValueError("SharedMemoryDataHandler needs a store")
+        if isinstance(store, dict):
+            store = SharedBarStore.attach(store)
+        self.store = store
+        super(SharedMemoryDataHandler, self).__init__(events, csv_dir, symbol_list, start_date, end_date)
+
+    def _open_convert_csv_files(self):
+        """
+        take views of bar_index and bar_columns from the store
+        """
+        store = self.store
+        times = store.bar_times
+        start, stop = 0, len(times)
+        if self.start_date is not None:
+            start = np.searchsorted(times, pd.Timestamp(self.start_date).value, side='left')
+        if self.end_date is not None:
+            stop = np.searchsorted(times, pd.Timestamp(self.end_date).value, side='right')
+
+        try:
+            cols = [store.symbol_list.index(s) for s in self.symbol_list]
+        except ValueError:
+            print("That symbol is not available in the shared data set")
+            raise
+        if cols == list(range(cols[0], cols[0] + len(cols))):
+            cols = slice(cols[0], cols[0] + len(cols))
+
+        self.bar_index = store.bar_index[start:stop]
+        self.bar_times = times[start:stop]
+        for f in self.fields:
+            self.bar_columns[f] = store.bar_columns[f][start:stop, cols]
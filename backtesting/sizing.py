@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Position sizing models used by Portfolio.generate_navie_order.
+
+A sizer is fed the latest price vector of all symbols on every bar and turns a SignalEvent
+into an order quantity. The risk based sizers share an exponentially weighted covariance
+matrix that is updated incrementally in O(n^2) per bar.
+"""
+
+from __future__ import print_function
+
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+
+from performance import infer_periods
+
+
+class EWMACovariance(object):
+    """
+    Exponentially weighted mean and covariance of a return vector, updated one bar at a time.
+    """
+
+    def __init__(self, n, decay=0.94, halflife=None):
+        """
+        :param n: int; the number of symbols
+
+        :param decay: float; weight of the previous estimate, 0.94 is the RiskMetrics daily value
+
+        :param halflife: float; half life in bars, overrides decay if given
+
+        :param mean: ndarray; the weighted mean of the returns
+
+        :param covariance: ndarray; n x n weighted covariance of the returns
+
+        :param count: int; the number of updates so far
+        """
+        if halflife is not None:
+            decay = 0.5 ** (1.0 / halflife)
+        if not 0.0 < decay < 1.0:
+            raise ValueError("decay should be in (0, 1): %s" % decay)
+        self.n = n
+        self.decay = decay
+        self.mean = np.zeros(n)
+        self.covariance = np.zeros((n, n))
+        self.count = 0
+
+    def update(self, returns):
+        """
+        add the returns of one bar to the estimate, missing (nan) returns count as 0
+
+        :param returns: ndarray; returns of all symbols for the bar
+        """
+        returns = np.nan_to_num(np.asarray(returns, dtype=np.float64))
+        if self.count == 0:
+            self.mean[:] = returns
+        else:
+            diff = returns - self.mean
+            incr = (1.0 - self.decay) * diff
+            self.mean += incr
+            self.covariance += np.outer(diff, incr)
+            self.covariance *= self.decay
+        self.count += 1
+
+    def volatility(self):
+        """
+        :return: ndarray; per bar volatility of each symbol
+        """
+        return np.sqrt(np.diag(self.covariance))
+
+
+class PositionSizer(object):
+    """
+    PositionSizer is an abstract class that provides an interface for all position sizing models.
+    """
+    __metaclass__ = ABCMeta
+
+    def update(self, prices):
+        """
+        receive the latest prices of all symbols, called by Portfolio.update_timeindex() on each bar
+
+        :param prices: ndarray; latest prices ordered as Portfolio.symbol_list
+        """
+        pass
+
+    @abstractmethod
+    def order_quantity(self, portfolio, symbol, strength):
+        """
+        :param portfolio: Portfolio; the portfolio asking for the quantity
+
+        :param symbol: string; the ticker symbol
+
+        :param strength: float; SignalEvent.strength
+
+        :return: int; no-negative quantity of a new position
+        """
+        raise NotImplementedError("should implement order_quantity()")
+
+
+class FixedQuantitySizer(PositionSizer):
+    """
+    trades a fixed quantity scaled by the signal strength
+    """
+
+    def __init__(self, quantity=100):
+        """
+        :param quantity: int; quantity for a signal of strength 1.0
+        """
+        self.quantity = quantity
+
+    def order_quantity(self, portfolio, symbol, strength):
+        return int(round(self.quantity * abs(strength)))
+
+
+class CovarianceSizer(PositionSizer):
+    """
+    base class of sizers that turn target weights of the equity into quantities.
+    Subclasses implement target_weights() from the EWMA covariance estimate.
+    """
+
+    def __init__(self, decay=0.94, halflife=None, min_periods=20, periods=None):
+        """
+        :param decay: float; decay of the EWMACovariance
+
+        :param halflife: float; half life in bars of the EWMACovariance, overrides decay
+
+        :param min_periods: int; no position is opened before this many returns are seen
+
+        :param periods: int; bars per year, used to annualize volatilities, None to infer it from the bars per year of the data
+        """
+        self.decay = decay
+        self.halflife = halflife
+        self.min_periods = min_periods
+        self.periods = periods
+        self.annual_periods = periods
+        self.estimator = None
+        self.prices = None
+        self.weights = None
+
+    def update(self, prices):
+        if self.estimator is None:
+            self.estimator = EWMACovariance(len(prices), decay=self.decay, halflife=self.halflife)
+        elif self.prices is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.estimator.update(prices / self.prices - 1.0)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.weights = None
+
+    @abstractmethod
+    def target_weights(self):
+        """
+        :return: ndarray; target fraction of equity held in each symbol
+        """
+        raise NotImplementedError("should implement target_weights()")
+
+    def order_quantity(self, portfolio, symbol, strength):
+        if self.estimator is None or self.estimator.count < self.min_periods:
+            return 0
+        if self.annual_periods is None:
+            self.annual_periods = infer_periods(portfolio.bars.bar_index)
+        if self.weights is None:
+            self.weights = self.target_weights()
+        i = portfolio.symbol_index[symbol]
+        price = self.prices[i]
+        if not price > 0:
+            return 0
+        equity = portfolio.all_holdings[-1]['total']
+        return int(abs(self.weights[i] * strength) * equity // price)
+
+
+class VolatilityTargetSizer(CovarianceSizer):
+    """
+    sizes each symbol so that its position has an annualized volatility of target_vol / n
+    """
+
+    def __init__(self, target_vol=0.10, max_weight=1.0, **kwargs):
+        """
+        :param target_vol: float; annualized volatility target of the portfolio
+
+        :param max_weight: float; cap of the weight of one symbol
+        """
+        super(VolatilityTargetSizer, self).__init__(**kwargs)
+        self.target_vol = target_vol
+        self.max_weight = max_weight
+
+    def target_weights(self):
+        vol = self.estimator.volatility() * np.sqrt(self.annual_periods)
+        with np.errstate(divide='ignore'):
+            weights = np.where(vol > 0, self.target_vol / (vol * len(vol)), 0.0)
+        return np.minimum(weights, self.max_weight)
+
+
+class RiskParitySizer(CovarianceSizer):
+    """
+    equal risk contribution weights, scaled to a gross leverage
+    """
+
+    def __init__(self, leverage=1.0, iterations=50, tolerance=1e-8, **kwargs):
+        """
+        :param leverage: float; sum of the weights
+
+        :param iterations: int; maximum fixed point iterations
+
+        :param tolerance: float; stop once the weights change less than this
+        """
+        super(RiskParitySizer, self).__init__(**kwargs)
+        self.leverage = leverage
+        self.iterations = iterations
+        self.tolerance = tolerance
+
+    def target_weights(self):
+        cov = self.estimator.covariance
+        vol = np.sqrt(np.diag(cov))
+        active = vol > 0
+        weights = np.zeros(len(vol))
+        if not active.any():
+            return weights
+
+        # start from inverse volatility, then iterate w_i ~ 1 / (cov w)_i
+        sub = cov[np.ix_(active, active)]
+        w = 1.0 / vol[active]
+        w /= w.sum()
+        for _ in range(self.iterations):
+            marginal = sub.dot(w)
+            new_w = np.where(marginal > 0, 1.0 / np.maximum(marginal, 1e-300), 0.0)
+            new_w = np.sqrt(w * new_w)
+            new_w /= new_w.sum()
+            if np.abs(new_w - w).max() < self.tolerance:
+                w = new_w
+                break
+            w = new_w
+        weights[active] = w * self.leverage
+        return weights
+
+
+class MeanVarianceSizer(CovarianceSizer):
+    """
+    mean-variance weights (cov + ridge)^-1 * mean / risk_aversion with weight and leverage constraints
+    """
+
+    def __init__(self, risk_aversion=1.0, ridge=1e-8, long_only=True, max_weight=1.0, leverage=1.0, **kwargs):
+        """
+        :param risk_aversion: float; risk aversion of the investor
+
+        :param ridge: float; added to the diagonal so the covariance can be inverted
+
+        :param long_only: boolean; drop negative weights
+
+        :param max_weight: float; cap of the absolute weight of one symbol
+
+        :param leverage: float; cap of the sum of the absolute weights
+        """
+        super(MeanVarianceSizer, self).__init__(**kwargs)
+        self.risk_aversion = risk_aversion
+        self.ridge = ridge
+        self.long_only = long_only
+        self.max_weight = max_weight
+        self.leverage = leverage
+
+    def target_weights(self):
+        cov = self.estimator.covariance + self.ridge * np.eye(self.estimator.n)
+        weights = np.linalg.solve(cov, self.estimator.mean) / self.risk_aversion
+        lower = 0.0 if self.long_only else -self.max_weight
+        weights = np.clip(weights, lower, self.max_weight)
+        gross = np.abs(weights).sum()
+        if gross > self.leverage:
+            weights *= self.leverage / gross
+        return weights
@@ -8,6 +8,7 @@ Created on Tue Apr  4 19:18:12 2017
 from __future__ import print_function
 
 from abc import ABCMeta, abstractmethod
+from multiprocessing.pool import ThreadPool
 
 try:
     import Queue as queue
@@ -25,3 +26,56 @@ class Strategy(object):
     @abstractmethod
     def calculate_signals(self):
         raise NotImplementedError("Should implement calculate_signals()")
+
+    def calculate_symbol_signals(self, symbol):
+        """
+        signals of one symbol for the latest bar, used by symbols_signals().
+        It may run in a worker thread, so it may only change the state of its own symbol.
+
+        :param symbol: string; the ticker symbol
+
+        :return: list; SignalEvent of the symbol
+        """
+        raise NotImplementedError("Should implement calculate_symbol_signals()")
+
+    def _chunk_signals(self, symbols):
+        signals = []
+        for s in symbols:
+            signals.extend(self.calculate_symbol_signals(s))
+        return signals
+
+    def symbols_signals(self, threads=1):
+        """
+        calculate_symbol_signals() of every symbol, the symbols are split into contiguous chunks over a
+        persistent thread pool when threads > 1. This pays off when the work of a symbol releases the GIL
+        (numpy, nogil kernels). The signals are returned in symbol_list order, as the serial loop does.
+
+        :param threads: int; worker threads, 1 to run serially in this thread
+
+        :return: list; SignalEvent of all symbols ordered as symbol_list
+        """
+        symbols = self.symbol_list
+        if threads <= 1 or len(symbols) < 2:
+            return self._chunk_signals(symbols)
+
+        if getattr(self, '_pool', None) is None or self._pool_size != threads:
+            self.close()
+            self._pool = ThreadPool(threads)
+            self._pool_size = threads
+        size, extra = divmod(len(symbols), threads)
+        chunks, start = [], 0
+        for i in range(min(threads, len(symbols))):
+            stop = start + size + (1 if i < extra else 0)
+            chunks.append(symbols[start:stop])
+            start = stop
+        return [signal for chunk in self._pool.map(self._chunk_signals, chunks) for signal in chunk]
+
+    def close(self):
+        """
+        stop the thread pool of symbols_signals()
+        """
+        pool = getattr(self, '_pool', None)
+        if pool is not None:
+            pool.close()
+            pool.join()
+            self._pool = None
@@ -2,24 +2,27 @@ from __future__ import print_function
 
 import datetime
 
-import numpy as np
-
 from backtest import Backtest
 from data import HistoricCSVDataHandler
 from event import SignalEvent
 from excaution import SimulatedExecutionHandler
+from kernels import SIGNAL_LONG, SIGNAL_EXIT, STATE_CODES, STATE_NAMES, moving_average_cross
 from portfolio import Portfolio
 from strategy import Strategy
 
 
 class MovingAverageCrossStrategy(Strategy):
 
-    def __init__(self, bars, events, short_window=10, long_window=30):
+    def __init__(self, bars, events, short_window=10, long_window=30, threads=1):
+        """
+        :param threads: int; worker threads computing the symbols of a bar, 1 for the serial loop
+        """
         self.bars = bars
         self.symbol_list = self.bars.symbol_list
         self.events = events
         self.short_window = short_window
         self.long_window = long_window
+        self.threads = threads
         self.bought = self._calculate_initial_bought()
 
     def _calculate_initial_bought(self):
@@ -29,33 +32,31 @@ class MovingAverageCrossStrategy(Strategy):
         bought = {s: 'OUT' for s in self.symbol_list}
         return bought
 
-    def calculate_signals(self, event):
-        if event.type == 'MARKET':
-            for s in self.symbol_list:
-                bars = self.bars.get_latest_bars_values(s, 'adj_close', N=self.long_window)
-                bar_date = self.bars.get_latest_bar_datetime(s)
-                if bars is not None and bars != []:
-                    short_sma = np.mean(bars[-self.short_window:])
-                    long_sma = np.mean(bars[-self.long_window:])
-
-                    symbol = s
-                    dt = datetime.datetime.utcnow()
-                    sig_dir = ""
+    def calculate_symbol_signals(self, s):
+        bars = self.bars.get_latest_bars_values(s, 'adj_close', N=self.long_window)
+        if bars is not None and len(bars) > 0:
+            state, sig = moving_average_cross(bars, self.short_window, self.long_window,
+                                              STATE_CODES[self.bought[s]])
+            self.bought[s] = STATE_NAMES[state]
 
-                    if short_sma > long_sma and self.bought[s] == "OUT":
-                        print("LONG: %s" % bar_date)
-                        sig_dir = 'LONG'
+            symbol = s
+            dt = datetime.datetime.utcnow()
 
-                        signal = SignalEvent(1, symbol, dt, sig_dir, 1.0)
-                        self.events.put(signal)
-                        self.bought[s] = 'LONG'
+            if sig == SIGNAL_LONG:
+                return [SignalEvent(1, symbol, dt, 'LONG', 1.0)]
+            elif sig == SIGNAL_EXIT:
+                return [SignalEvent(1, symbol, dt, 'EXIT', 1.0)]
+        return []
 
-                    elif short_sma < long_sma and self.bought[s] == "LONG":
-                        print("SHORT: %s" % bar_date)
-                        sig_dir = 'EXIT'
-                        signal = SignalEvent(1, symbol, dt, sig_dir, 1.0)
-                        self.events.put(signal)
-                        self.bought[s] = 'OUT'
+    def calculate_signals(self, event):
+        if event.type == 'MARKET':
+            for signal in self.symbols_signals(self.threads):
+                bar_date = self.bars.get_latest_bar_datetime(signal.symbol)
+                if signal.signal_type == 'LONG':
+                    print("LONG: %s" % bar_date)
+                else:
+                    print("SHORT: %s" % bar_date)
+                self.events.put(signal)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+"""
+Benchmark of the thread pool signal stage (Strategy.symbols_signals) against the serial loop.
+
+The strategy fits an autoregression of the returns of every symbol on every bar with numpy/LAPACK,
+which releases the GIL. The signal stage is timed for growing universes and thread counts,
+and the crossover is the smallest universe from which threads beat the serial loop.
+
+usage: python thread_benchmark.py [--symbols 1,2,4,8,16,32,64] [--threads 2,4] [--bars 100] [--lags 32]
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backtesting'))
+
+from data import HistoricCSVDataHandler
+from event import SignalEvent
+from strategy import Strategy
+
+
+class AutoRegressionStrategy(Strategy):
+    """
+    goes long when a least squares autoregression of the returns predicts a rise
+    """
+
+    def __init__(self, bars, events, window=256, lags=32, threads=1):
+        self.bars = bars
+        self.symbol_list = self.bars.symbol_list
+        self.events = events
+        self.window = window
+        self.lags = lags
+        self.threads = threads
+        self.bought = dict((s, False) for s in self.symbol_list)
+        self._prices = None
+
+    def calculate_symbol_signals(self, s):
+        prices = self._prices[self.bars.symbol_index[s]]
+        if len(prices) <= self.lags + 1:
+            return []
+        returns = np.diff(np.log(prices))
+        n = len(returns) - self.lags
+        lagged = np.lib.stride_tricks.as_strided(returns, (n, self.lags), (returns.strides[0],) * 2)
+        x, y = lagged[:-1], returns[self.lags:self.lags + n - 1]
+        coef = np.linalg.solve(np.dot(x.T, x) + 1e-9 * np.eye(self.lags), np.dot(x.T, y))
+        rise = np.dot(lagged[-1], coef) > 0
+
+        if rise and not self.bought[s]:
+            self.bought[s] = True
+            return [SignalEvent(1, s, None, 'LONG', 1.0)]
+        if not rise and self.bought[s]:
+            self.bought[s] = False
+            return [SignalEvent(1, s, None, 'EXIT', 1.0)]
+        return []
+
+    def calculate_signals(self, event):
+        if event.type == 'MARKET':
+            # read the data once in this thread, the per symbol work runs in the pool
+            self._prices = self.bars.get_latest_symbols_bars_values('adj_close', N=self.window)
+            for signal in self.symbols_signals(self.threads):
+                self.events.put(signal)
+
+
+def make_data(csv_dir, n_symbols, n_bars):
+    rng = np.random.RandomState(0)
+    index = pd.date_range('2010-01-01', periods=n_bars, freq='D')
+    for i in range(n_symbols):
+        close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, n_bars)))
+        frame = pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close,
+                              'volume': 1000.0, 'adj_close': close}, index=index)
+        frame.index.name = 'datetime'
+        frame[['open', 'high', 'low', 'close', 'volume', 'adj_close']].to_csv(os.path.join(csv_dir, 'S%d.csv' % i))
+
+
+def time_signals(csv_dir, symbol_list, threads, window, lags, n_bars):
+    """
+    :return: (float, list); seconds spent in calculate_signals and the (symbol, signal_type) sequence
+    """
+    events = queue.Queue()
+    bars = HistoricCSVDataHandler(events, csv_dir, symbol_list)
+    strategy = AutoRegressionStrategy(bars, events, window, lags, threads)
+    for _ in range(window):
+        bars.update_bars()
+    while not events.empty():
+        events.get()
+
+    elapsed, signals = 0.0, []
+    for _ in range(n_bars):
+        bars.update_bars()
+        market = events.get()
+        start = time.time()
+        strategy.calculate_signals(market)
+        elapsed += time.time() - start
+        while not events.empty():
+            signal = events.get()
+            signals.append((signal.symbol, signal.signal_type))
+    strategy.close()
+    return elapsed, signals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the thread pool signal stage against the serial loop.")
+    parser.add_argument('--symbols', default='1,2,4,8,16,32,64', help="comma separated universe sizes")
+    parser.add_argument('--threads', default=None, help="comma separated thread counts, default: 2 and the cores")
+    parser.add_argument('--bars', type=int, default=100, help="timed bars")
+    parser.add_argument('--window', type=int, default=256, help="bars of the regression")
+    parser.add_argument('--lags', type=int, default=32, help="lags of the regression")
+    args = parser.parse_args(argv)
+
+    universes = [int(n) for n in args.symbols.split(',')]
+    cores = multiprocessing.cpu_count()
+    threads = [int(n) for n in args.threads.split(',')] if args.threads else sorted(set([2, max(2, cores)]))
+
+    csv_dir = tempfile.mkdtemp()
+    try:
+        make_data(csv_dir, max(universes), args.window + args.bars)
+        rows = []
+        for n in universes:
+            symbol_list = ['S%d' % i for i in range(n)]
+            serial, expected = time_signals(csv_dir, symbol_list, 1, args.window, args.lags, args.bars)
+            row = {'symbols': n, 'serial': serial}
+            for t in threads:
+                if n < 2:
+                    continue  # a single symbol always runs serially
+                elapsed, signals = time_signals(csv_dir, symbol_list, t, args.window, args.lags, args.bars)
+                if signals != expected:
+                    raise AssertionError("%d threads changed the signals of %d symbols" % (t, n))
+                row['%d threads' % t] = elapsed
+            rows.append(row)
+    finally:
+        shutil.rmtree(csv_dir)
+
+    result = pd.DataFrame(rows).set_index('symbols')
+    print("cores: %d, seconds in calculate_signals over %d bars" % (cores, args.bars))
+    print(result)
+    faster = result.drop('serial', axis=1).min(axis=1) < result['serial']
+    # the smallest universe from which threads are faster for every larger one too
+    always = faster[::-1].cumprod()[::-1].astype(bool)
+    if always.any():
+        print("crossover: threads are faster from %d symbols" % always[always].index[0])
+    else:
+        print("crossover: threads are not faster for any universe size here")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'backtesting'))
+sys.path.insert(0, os.path.join(ROOT, 'demo'))
+
+CSV_DIR = os.path.join(ROOT, 'datas')
+START_DATE = datetime.datetime(2013, 4, 28)
+
+
+@pytest.fixture
+def csv_dir():
+    return CSV_DIR
+
+
+@pytest.fixture(scope='session')
+def synthetic_csv_dir(tmp_path_factory):
+    """
+    random walk bars of the symbols S0 ... S3, 400 days each
+    """
+    path = tmp_path_factory.mktemp('synthetic')
+    rng = np.random.RandomState(0)
+    index = pd.date_range('2010-01-01', periods=400, freq='D', name='datetime')
+    for i in range(4):
+        close = np.round(100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.02, len(index)))), 2)
+        frame = pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close, 'volume': 1000.0,
+                              'adj_close': close}, index=index)
+        frame.to_csv(str(path / ('S%d.csv' % i)))
+    return str(path)
+
+
+@pytest.fixture
+def run_demo(capsys):
+    """
+    run the moving average cross demo, on the bitcoin bars by default, without writing the equity curve
+    """
+    from backtest import Backtest
+    from data import HistoricCSVDataHandler
+    from excaution import SimulatedExecutionHandler
+    from mac import MovingAverageCrossStrategy
+    from portfolio import Portfolio
+
+    def run(portfolio_params=None, strategy=MovingAverageCrossStrategy, csv_dir=CSV_DIR, symbol_list=('bitcoin',),
+            start_date=START_DATE, **params):
+        portfolio_params = dict(portfolio_params or {}, output_path=None)
+        backtest = Backtest(csv_dir, list(symbol_list), 100000.0, 0.0, start_date, HistoricCSVDataHandler,
+                            SimulatedExecutionHandler, Portfolio, strategy,
+                            portfolio_params=portfolio_params, **params)
+        stats = backtest.simulate_trading()
+        capsys.readouterr()
+        return backtest, stats
+
+    return run
@@ -0,0 +1,46 @@
+import datetime
+
+import pytest
+
+from cache import ResultCache, _describe, cached_backtest, run_sweep
+from data import HistoricCSVDataHandler
+from excaution import SimulatedExecutionHandler
+from mac import MovingAverageCrossStrategy
+from portfolio import Portfolio
+from preprocess import Preprocessor
+from sizing import VolatilityTargetSizer
+
+
+def _sweep(cache, csv_dir, sizer):
+    return run_sweep(cache, {'short_window': [10], 'long_window': [30, 40]}, csv_dir=csv_dir, symbol_list=['bitcoin'],
+                     initial_capital=100000.0, start_date=datetime.datetime(2013, 4, 28),
+                     data_handler=HistoricCSVDataHandler, execution_handler=SimulatedExecutionHandler,
+                     portfolio=Portfolio, strategy=MovingAverageCrossStrategy, portfolio_params={'sizer': sizer})
+
+
+def test_an_identical_sweep_with_a_fresh_sizer_is_served_from_the_cache(tmp_path, csv_dir, capsys):
+    cache = ResultCache(str(tmp_path))
+    first = _sweep(cache, csv_dir, VolatilityTargetSizer(target_vol=0.2))
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    second = _sweep(cache, csv_dir, VolatilityTargetSizer(target_vol=0.2))
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert [r[2] for r in first] == [r[2] for r in second]
+
+    _sweep(cache, csv_dir, VolatilityTargetSizer(target_vol=0.3))
+    assert cache.misses == 4
+
+
+def test_objects_are_described_by_their_constructor_params(csv_dir, capsys):
+    preprocessor = Preprocessor()
+    before = _describe(preprocessor)
+    preprocessor.run(csv_dir, ['bitcoin'])
+    assert _describe(preprocessor) == before
+    assert _describe(Preprocessor(gap_factor=4.0)) != before
+
+
+def test_cached_runs_reject_a_fill_journal(tmp_path, csv_dir):
+    with pytest.raises(ValueError):
+        cached_backtest(ResultCache(str(tmp_path)), csv_dir, ['bitcoin'], 100000.0, datetime.datetime(2013, 4, 28),
+                        HistoricCSVDataHandler, SimulatedExecutionHandler, Portfolio, MovingAverageCrossStrategy,
+                        portfolio_params={'journal': str(tmp_path / 'fills.bin')})
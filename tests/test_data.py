@@ -0,0 +1,63 @@
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+import pytest
+
+from data import HistoricCSVDataHandler
+
+
+@pytest.fixture
+def bars(csv_dir):
+    return HistoricCSVDataHandler(queue.Queue(), csv_dir, ['bitcoin'])
+
+
+def test_symbols_value_before_the_first_bar_raises(bars):
+    with pytest.raises(IndexError):
+        bars.get_latest_symbols_value('adj_close')
+    bars.update_bars()
+    np.testing.assert_array_equal(bars.get_latest_symbols_value('adj_close'), bars.bar_columns['adj_close'][0])
+
+
+def test_symbols_bar_before_the_first_bar_raises(bars):
+    with pytest.raises(IndexError):
+        bars.get_latest_symbols_bar()
+    bars.update_bars()
+    np.testing.assert_array_equal(bars.get_latest_symbols_bar(['close', 'volume'])[0],
+                                  [bars.bar_columns['close'][0, 0], bars.bar_columns['volume'][0, 0]])
+
+
+def test_bar_time_before_the_first_bar_raises(bars):
+    with pytest.raises(IndexError):
+        bars.get_latest_bar_time('bitcoin')
+    assert bars.get_bar_asof('bitcoin', bars.bar_index[-1]) is None
+    bars.update_bars()
+    assert bars.get_latest_bar_time('bitcoin') == bars.bar_times[0]
+    assert bars.get_bar_asof('bitcoin', bars.bar_index[-1])[0] == bars.bar_times[0]
+
+
+def test_latest_bars_are_read_from_compact_columns(bars, csv_dir, capsys):
+    compact = HistoricCSVDataHandler(queue.Queue(), csv_dir, ['bitcoin'], column_policy='ticks', tick_sizes=0.01)
+    for _ in range(50):
+        bars.update_bars()
+        compact.update_bars()
+
+    np.testing.assert_array_equal(compact.get_latest_bars_values('bitcoin', 'adj_close', N=30),
+                                  bars.bar_columns['adj_close'][20:50, 0])
+    assert compact.get_latest_bar_value('bitcoin', 'close') == bars.bar_columns['close'][49, 0]
+    dt, bar = compact.get_latest_bar('bitcoin')
+    assert dt == bars.bar_index[49] == compact.get_latest_bar_datetime('bitcoin')
+    np.testing.assert_array_equal(bar.values, [bars.bar_columns[f][49, 0] for f in bars.fields])
+    assert [b[0] for b in compact.get_latest_bars('bitcoin', N=3)] == list(bars.bar_index[47:50])
+
+
+def test_volume_is_compacted_only_when_the_policy_names_it(bars, csv_dir, capsys):
+    ticks = HistoricCSVDataHandler(queue.Queue(), csv_dir, ['bitcoin'], column_policy='ticks', tick_sizes=0.01)
+    assert type(ticks.bar_columns['volume']) is np.ndarray and ticks.bar_columns['volume'].dtype == np.float64
+    np.testing.assert_array_equal(ticks.bar_columns['volume'], bars.bar_columns['volume'])
+
+    named = HistoricCSVDataHandler(queue.Queue(), csv_dir, ['bitcoin'], column_policy={'volume': 'ticks'},
+                                   lot_size=1e-6)
+    np.testing.assert_allclose(named.bar_columns['volume'][:], bars.bar_columns['volume'], rtol=1e-9)
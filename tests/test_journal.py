@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from conftest import START_DATE
+from costs import PerShareCommission
+from journal import read_journal, replay
+
+
+def _replay(backtest, path, **models):
+    symbol_list, records = read_journal(path)
+    bars = backtest.data_handler
+    return records, replay(records, symbol_list, bars.bar_index, bars.bar_columns['adj_close'],
+                           backtest.initial_capital, START_DATE, **models)
+
+
+def test_a_journal_opened_by_the_portfolio_is_closed_after_the_run(run_demo, tmp_path):
+    path = str(tmp_path / 'fills.bin')
+    backtest, stats = run_demo(portfolio_params={'journal': path})
+
+    assert backtest.portfolio.journal._file.closed
+    symbol_list, records = read_journal(path)
+    assert symbol_list == ['bitcoin']
+    assert len(records) == backtest.fills > 0
+
+
+def test_replay_rebuilds_the_equity_curve(run_demo, tmp_path):
+    path = str(tmp_path / 'fills.bin')
+    backtest, stats = run_demo(portfolio_params={'journal': path})
+    records, curve = _replay(backtest, path)
+
+    expected = backtest.portfolio.equity_curve
+    np.testing.assert_array_equal(curve.index, expected.index)
+    np.testing.assert_allclose(curve['total'].values, expected['total'].values, rtol=0, atol=1e-8)
+
+
+def test_another_commission_model_changes_only_the_fees(run_demo, tmp_path):
+    path = str(tmp_path / 'fills.bin')
+    backtest, stats = run_demo(portfolio_params={'journal': path})
+    model = PerShareCommission(per_share=0.05, minimum=1.0)
+    records, recorded = _replay(backtest, path)
+    records, repriced = _replay(backtest, path, commission_model=model)
+
+    pd.testing.assert_series_equal(repriced['bitcoin'], recorded['bitcoin'])
+    extra = repriced['commission'] - recorded['commission']
+    np.testing.assert_allclose(recorded['cash'] - repriced['cash'], extra, rtol=0, atol=1e-8)
+    np.testing.assert_allclose(recorded['total'] - repriced['total'], extra, rtol=0, atol=1e-8)
+    fees = [model.calculate(q, p) for q, p in zip(records['quantity'], records['price'])]
+    assert np.isclose(extra.iloc[-1], np.sum(fees) - records['commission'].sum())
+    assert extra.iloc[-1] > 0
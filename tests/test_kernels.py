@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+import kernels
+import mac
+
+
+def test_jit_and_python_kernels_give_identical_equity_curves(run_demo, monkeypatch):
+    compiled, compiled_stats = run_demo()
+    monkeypatch.setattr(mac, 'moving_average_cross', kernels.moving_average_cross.py_func)
+    python, python_stats = run_demo()
+
+    assert compiled.fills > 0
+    pd.testing.assert_frame_equal(compiled.portfolio.equity_curve, python.portfolio.equity_curve, check_exact=True)
+    assert compiled_stats == python_stats
+
+
+def test_jit_and_python_rolling_max_drawdown_are_identical():
+    values = np.cumprod(1.0 + np.random.RandomState(0).normal(0.0, 0.01, 1000))
+    for window in (1, 7, 64, 1000):
+        np.testing.assert_array_equal(kernels.rolling_max_drawdown(values, window),
+                                      kernels.rolling_max_drawdown.py_func(values, window))
@@ -0,0 +1,14 @@
+from mac import MovingAverageCrossStrategy
+from memory import check_scaling, memory_scaling
+
+
+def test_memory_grows_at_most_linearly_with_symbols_x_bars(synthetic_csv_dir, capsys):
+    symbol_list = ['S0', 'S1', 'S2', 'S3']
+    results = memory_scaling(synthetic_csv_dir, symbol_list, MovingAverageCrossStrategy, [1, 4], [100, 400])
+    exponents, failures = check_scaling(results, max_exponent=1.0, max_bytes_per_bar=1024)
+
+    assert failures == []
+    assert exponents.loc['total', 'exponent'] <= 1.0
+    # the warm-up run keeps one-off allocations out of the first measured run
+    for n_symbols, runs in results.groupby('symbols'):
+        assert runs['total'].is_monotonic_increasing
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+import preprocess
+from preprocess import Preprocessor
+
+
+def _split():
+    return pd.DataFrame({'symbol': ['bitcoin'], 'datetime': [pd.Timestamp('2015-01-05')], 'split': [2.0],
+                         'dividend': [0.0]})
+
+
+def test_a_corporate_action_is_reported_once(csv_dir, capsys):
+    bar_index, columns, report = Preprocessor(actions=_split()).run(csv_dir, ['bitcoin'])
+
+    adjusted = report[report['check'] == 'adjusted']
+    assert len(adjusted) == 1
+    assert adjusted['value'].iloc[0] == 0.5
+    t = bar_index.searchsorted(pd.Timestamp('2015-01-05'))
+    np.testing.assert_array_equal(columns['adj_close'][:t], columns['close'][:t] * 0.5)
+    np.testing.assert_array_equal(columns['adj_close'][t:], columns['close'][t:])
+
+
+def test_cached_arrays_depend_on_the_preprocess_version(csv_dir, tmp_path, monkeypatch, capsys):
+    preprocessor = Preprocessor(actions=_split(), cache_dir=str(tmp_path))
+    bar_index, columns, report = preprocessor.load(csv_dir, ['bitcoin'])
+    cached_index, cached_columns, cached_report = preprocessor.load(csv_dir, ['bitcoin'])
+
+    assert bar_index.equals(cached_index)
+    for f in preprocess.FIELDS:
+        np.testing.assert_array_equal(columns[f], cached_columns[f])
+    assert len(cached_report) == len(report)
+
+    key = preprocessor._cache_key(csv_dir, ['bitcoin'])
+    monkeypatch.setattr(preprocess, 'PREPROCESS_VERSION', preprocess.PREPROCESS_VERSION + '.next')
+    assert preprocessor._cache_key(csv_dir, ['bitcoin']) != key
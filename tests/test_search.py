@@ -0,0 +1,49 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from cache import ResultCache
+from data import HistoricCSVDataHandler
+from excaution import SimulatedExecutionHandler
+from mac import MovingAverageCrossStrategy
+from performance import infer_periods
+from portfolio import Portfolio
+from search import SuccessiveHalvingSearch, evaluate
+
+
+def test_evaluate_infers_bars_per_year_from_the_curve(run_demo):
+    backtest, stats = run_demo()
+    curve = backtest.portfolio.equity_curve
+
+    assert infer_periods(curve.index) == pytest.approx(365.25)
+    assert evaluate(curve) == evaluate(curve, periods=infer_periods(curve.index))
+    assert evaluate(curve)['sharpe_ratio'] != evaluate(curve, periods=252)['sharpe_ratio']
+
+
+def test_bars_per_year_follow_the_calendar_of_the_data():
+    weekdays = pd.bdate_range('2015-01-01', '2019-12-31')
+    hours = pd.date_range('2019-01-01', '2019-12-31 23:00', freq='h')
+
+    assert infer_periods(weekdays) == pytest.approx(261, abs=1)
+    assert infer_periods(hours) == pytest.approx(24 * 365.25, rel=1e-3)
+    assert infer_periods(weekdays[::5]) == pytest.approx(52.2, abs=0.1)
+
+
+def test_a_cached_search_counts_only_the_bars_it_simulates(tmp_path, csv_dir, capsys):
+    cache = ResultCache(str(tmp_path))
+
+    def search():
+        s = SuccessiveHalvingSearch({'short_window': [5, 10], 'long_window': [30, 40]}, eta=2, cache=cache,
+                                    csv_dir=csv_dir, symbol_list=['bitcoin'], initial_capital=100000.0,
+                                    start_date=datetime.datetime(2013, 4, 28), data_handler=HistoricCSVDataHandler,
+                                    execution_handler=SimulatedExecutionHandler, portfolio=Portfolio,
+                                    strategy=MovingAverageCrossStrategy)
+        return s, s.run()
+
+    first, ranked = search()
+    assert first.bars_simulated > 0
+    second, again = search()
+    assert second.bars_simulated == 0
+    assert second.saved() == 1.0
+    assert [r[0] for r in again] == [r[0] for r in ranked]
@@ -0,0 +1,69 @@
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import run
+from backtest import Backtest
+from data import HistoricCSVDataHandler
+from excaution import SimulatedExecutionHandler
+from mac import MovingAverageCrossStrategy
+from portfolio import Portfolio
+from shard import ShardedBacktest
+
+
+def test_a_sharded_backtest_rejects_a_fill_journal(csv_dir, tmp_path):
+    with pytest.raises(ValueError):
+        ShardedBacktest(csv_dir, ['bitcoin'], 100000.0, 0.0, datetime.datetime(2013, 4, 28), HistoricCSVDataHandler,
+                        SimulatedExecutionHandler, Portfolio, MovingAverageCrossStrategy,
+                        portfolio_params={'journal': str(tmp_path / 'fills.bin')})
+
+
+def test_a_config_cannot_both_cache_and_shard(csv_dir, tmp_path):
+    config = {
+        'data': {'csv_dir': csv_dir, 'symbols': ['bitcoin']},
+        'strategy': {'path': 'mac.MovingAverageCrossStrategy'},
+        'cache': {'dir': str(tmp_path / 'cache')},
+        'shard': {'processes': 1},
+    }
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(config))
+    with pytest.raises(ValueError):
+        run.main([str(path)])
+
+
+@pytest.fixture(scope='module')
+def staggered_csv_dir(tmp_path_factory):
+    """
+    random walk bars of the symbols T0 ... T3, whose histories start 0, 45, 90 and 135 days late
+    """
+    path = tmp_path_factory.mktemp('staggered')
+    rng = np.random.RandomState(1)
+    for i in range(4):
+        index = pd.date_range('2010-01-01', periods=400, freq='D', name='datetime')[45 * i:]
+        close = np.round(100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.02, len(index)))), 2)
+        frame = pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close, 'volume': 1000.0,
+                              'adj_close': close}, index=index)
+        frame.to_csv(str(path / ('T%d.csv' % i)))
+    return str(path)
+
+
+@pytest.mark.parametrize('shared_memory', [False, True])
+def test_shards_of_staggered_histories_match_the_unsharded_run(staggered_csv_dir, shared_memory, capsys):
+    args = (staggered_csv_dir, ['T0', 'T1', 'T2', 'T3'], 100000.0, 0.0, datetime.datetime(2010, 1, 1),
+            HistoricCSVDataHandler, SimulatedExecutionHandler, Portfolio, MovingAverageCrossStrategy)
+    backtest = Backtest(*args, portfolio_params={'output_path': None})
+    backtest.simulate_trading()
+    sharded = ShardedBacktest(*args, group_size=1, processes=1, shared_memory=shared_memory, output_path=None)
+    sharded.simulate_trading()
+
+    assert sharded.fills == backtest.fills > 0
+    expected = backtest.portfolio.equity_curve
+    np.testing.assert_array_equal(sharded.equity_curve.index, expected.index)
+    # the unsharded total is NaN until every symbol has a price
+    priced = expected['total'].notnull().values
+    assert priced[1 + 135:].all()
+    np.testing.assert_allclose(sharded.equity_curve['total'].values[priced], expected['total'].values[priced],
+                               rtol=1e-12)
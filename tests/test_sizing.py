@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+from sizing import VolatilityTargetSizer
+
+
+def test_a_sizer_shared_by_backtests_does_not_leak_state(run_demo):
+    sizer = VolatilityTargetSizer(target_vol=0.2)
+    first, first_stats = run_demo(portfolio_params={'sizer': sizer})
+    second, second_stats = run_demo(portfolio_params={'sizer': sizer})
+
+    assert sizer.estimator is None and sizer.prices is None
+    assert first.fills > 0
+    pd.testing.assert_frame_equal(first.portfolio.equity_curve, second.portfolio.equity_curve, check_exact=True)
+    assert first_stats == second_stats
+
+
+def test_the_sizer_infers_bars_per_year_from_the_bars(run_demo):
+    inferred, inferred_stats = run_demo(portfolio_params={'sizer': VolatilityTargetSizer(target_vol=0.2)})
+    daily, daily_stats = run_demo(portfolio_params={'sizer': VolatilityTargetSizer(target_vol=0.2, periods=365.25)})
+
+    # bitcoin trades every day of the year
+    assert inferred.portfolio.sizer.annual_periods == pytest.approx(365.25)
+    assert inferred_stats == daily_stats
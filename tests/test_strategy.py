@@ -0,0 +1,50 @@
+import datetime
+import threading
+
+import pandas as pd
+import pytest
+
+from data import HistoricCSVDataHandler
+from excaution import SimulatedExecutionHandler
+from mac import MovingAverageCrossStrategy
+from portfolio import Portfolio
+from shard import ShardedBacktest
+
+
+class FailingStrategy(MovingAverageCrossStrategy):
+    calls = 0
+
+    def calculate_signals(self, event):
+        FailingStrategy.calls += 1
+        if FailingStrategy.calls == 50:
+            raise RuntimeError("failed on a bar")
+        super(FailingStrategy, self).calculate_signals(event)
+
+
+def test_threads_give_the_signals_of_the_serial_loop(run_demo, synthetic_csv_dir):
+    symbols = dict(csv_dir=synthetic_csv_dir, symbol_list=['S0', 'S1', 'S2', 'S3'],
+                   start_date=datetime.datetime(2010, 1, 1))
+    serial, serial_stats = run_demo(strategy_params={'threads': 1}, **symbols)
+    threaded, threaded_stats = run_demo(strategy_params={'threads': 2}, **symbols)
+
+    pd.testing.assert_frame_equal(serial.portfolio.equity_curve, threaded.portfolio.equity_curve, check_exact=True)
+    assert threaded.fills > 0
+    assert threaded.strategy._pool is None
+
+
+def test_the_thread_pool_is_stopped_when_the_run_fails(run_demo, synthetic_csv_dir):
+    threads = threading.active_count()
+    with pytest.raises(RuntimeError):
+        run_demo(strategy=FailingStrategy, strategy_params={'threads': 2}, csv_dir=synthetic_csv_dir,
+                 symbol_list=['S0', 'S1'], start_date=datetime.datetime(2010, 1, 1))
+    assert threading.active_count() == threads
+
+
+def test_shards_stop_their_thread_pools(synthetic_csv_dir, capsys):
+    threads = threading.active_count()
+    backtest = ShardedBacktest(synthetic_csv_dir, ['S0', 'S1', 'S2', 'S3'], 100000.0, 0.0,
+                               datetime.datetime(2010, 1, 1), HistoricCSVDataHandler, SimulatedExecutionHandler,
+                               Portfolio, MovingAverageCrossStrategy, strategy_params={'threads': 2},
+                               shards=2, processes=1, output_path=None)
+    backtest.simulate_trading()
+    assert threading.active_count() == threads